@@ -0,0 +1,231 @@
+import numpy as np
+import pandas as pd
+
+from instrument import note, phase
+
+# Pure NumPy re-implementation of bc_6_3.nlogo (setup + go) that needs no JVM.
+# State is held as (replicates x agents) arrays so several independent runs
+# can be advanced together. Every replicate draws from its own generator, so
+# a replicate run with seed s is the single run with seed s. The drawing part of the NetLogo model is skipped
+# because nothing of it is used in the fitting pipeline.
+
+def as_bool(value):
+    # MyModel passes original either as bool or as the string "true"/"false"
+    return str(value).lower() == 'true'
+
+def is_extremist(opinion, extremism_type, extremism_range):
+    if extremism_type == "two side":
+        return 0.5 - np.abs(opinion - 0.5) < extremism_range
+    if extremism_type == "one side":
+        return opinion < extremism_range
+    return np.zeros_like(opinion, dtype=bool)
+
+class BoundedConfidenceEngine:
+    def __init__(self, parameters, n_replicates=1, seed=None):
+        self.original = as_bool(parameters["original"])
+        self.communication_regime = parameters["communication_regime"]
+        self.number_of_agents = int(parameters["number_of_agents"])
+        self.extremism_range = float(parameters["extremism_range"])
+        self.extremism_type = parameters["extremism_type"]
+        self.alpha = float(parameters["alpha"])
+        self.beta = float(parameters["beta"])
+        self.entry_exit_rate = float(parameters["entry_exit_rate"])
+        self.min_eps = float(parameters["min_eps"])
+        self.max_eps = float(parameters["max_eps"])
+        self.aggregation_in_HK = parameters.get("aggregation_in_HK", "mean")
+        self.n_replicates = n_replicates
+        # seed: one per replicate, or a single one (spawning the replicates')
+        if isinstance(seed, (list, tuple, np.ndarray)):
+            seeds = list(seed)
+        elif n_replicates == 1:
+            seeds = [seed]
+        else:
+            seeds = np.random.SeedSequence(seed).spawn(n_replicates)
+        if len(seeds) != n_replicates:
+            raise ValueError(f"{len(seeds)} seeds for {n_replicates} replicates")
+        self.rngs = [np.random.default_rng(s) for s in seeds]
+        self.ticks = 0
+
+    def setup(self):
+        n = self.number_of_agents
+        self.opinion = np.array([rng.random(n) for rng in self.rngs])
+        # eps ~ Beta(alpha, beta), scaled and shifted to [min_eps, max_eps]
+        eps = np.array([rng.beta(self.alpha, self.beta, size=n) for rng in self.rngs])
+        self.eps = self.min_eps + eps * (self.max_eps - self.min_eps)
+        self.ticks = 0
+        return self
+
+    def go(self):
+        if self.communication_regime == "DW (select one)":
+            self._update_dw()
+        elif self.communication_regime == "HK (select all)":
+            if self.original:
+                self._update_hk_synchronous()
+            else:
+                self._update_hk_sequential()
+
+        # entry-exit: randomly reset opinion with probability entry_exit_rate
+        for opinion, rng in zip(self.opinion, self.rngs):
+            reset = rng.random(self.number_of_agents) < self.entry_exit_rate
+            opinion[reset] = rng.random(np.count_nonzero(reset))
+
+        self.ticks += 1
+        return self
+
+    def run(self, ticks=1):
+        for _ in range(ticks):
+            self.go()
+        return self
+
+    def _aggregate(self, window_sum, sorted_opinions, lo, count):
+        # Mean or median of the sorted window [lo, lo + count)
+        if self.aggregation_in_HK == "median":
+            middle = lo + count // 2
+            upper = sorted_opinions[middle]
+            lower = sorted_opinions[np.where(count % 2 == 0, middle - 1, middle)]
+            return (upper + lower) / 2
+        return window_sum / count
+
+    def _update_hk_synchronous(self):
+        # Original HK: every agent looks at the opinions of the last tick, so
+        # all updates are independent and can be done at once. Neighbours
+        # within eps are found by binary search in the sorted opinions and
+        # their sum is read off a prefix sum instead of filtering all turtles.
+        old = self.opinion
+        n_rep, n = old.shape
+
+        # Offset each replicate so all of them fit in one sorted flat array
+        offset = 4.0 * np.arange(n_rep)[:, None]
+        sorted_old = np.sort(old, axis=1)
+        sorted_flat = (sorted_old + offset).ravel()
+        # One prefix sum per replicate (a row of n + 1), so a replicate's sums
+        # are those of a single run; flat index k of row r is k + r in it
+        prefix = np.zeros((n_rep, n + 1))
+        np.cumsum(sorted_old, axis=1, out=prefix[:, 1:])
+        prefix = prefix.ravel()
+        row = np.repeat(np.arange(n_rep), n)
+
+        lo = np.searchsorted(sorted_flat, (old - self.eps + offset).ravel(), side='right')
+        hi = np.searchsorted(sorted_flat, (old + self.eps + offset).ravel(), side='left')
+        count = hi - lo
+
+        # An empty neighbourhood (eps = 0) makes NetLogo fail on "mean of an
+        # empty list"; here the agent simply keeps its opinion.
+        has_neighbours = (count > 0).reshape(old.shape)
+        new = self._aggregate(prefix[hi + row] - prefix[lo + row], sorted_old.ravel(),
+                              np.minimum(lo, sorted_flat.size - 1), np.maximum(count, 1))
+        new = new.reshape(old.shape)
+
+        keep = ~has_neighbours | is_extremist(old, self.extremism_type, self.extremism_range)
+        self.opinion = np.where(keep, old, new)
+
+    def _update_hk_sequential(self):
+        # Non-original HK: agents update one after another in random order and
+        # see the opinions already changed in this tick. The sorted opinions
+        # and their prefix sum are kept up to date after every single update.
+        n = self.number_of_agents
+        for r in range(self.n_replicates):
+            opinion = self.opinion[r]
+            eps = self.eps[r]
+            sorted_opinions = np.sort(opinion)
+            prefix = np.zeros(n + 1)
+            np.cumsum(sorted_opinions, out=prefix[1:])
+
+            for i in self.rngs[r].permutation(n):
+                x = opinion[i]
+                if is_extremist(x, self.extremism_type, self.extremism_range):
+                    continue
+                lo = np.searchsorted(sorted_opinions, x - eps[i], side='right')
+                hi = np.searchsorted(sorted_opinions, x + eps[i], side='left')
+                count = hi - lo
+                if count == 0:
+                    continue
+                new = float(self._aggregate(prefix[hi] - prefix[lo], sorted_opinions, lo, count))
+
+                # Move x to the position of new in the sorted array
+                k = np.searchsorted(sorted_opinions, x, side='left')
+                if new > x:
+                    j = np.searchsorted(sorted_opinions, new, side='right') - 1
+                    sorted_opinions[k:j] = sorted_opinions[k + 1:j + 1]
+                else:
+                    j = np.searchsorted(sorted_opinions, new, side='left')
+                    sorted_opinions[j + 1:k + 1] = sorted_opinions[j:k]
+                sorted_opinions[j] = new
+                start = min(j, k)
+                np.cumsum(sorted_opinions[start:], out=prefix[start + 1:])
+                prefix[start + 1:] += prefix[start]
+
+                opinion[i] = new
+
+    def _update_dw(self):
+        # Deffuant-Weisbuch: pairwise averaging with a random partner. In the
+        # original version N random agents are drawn with replacement and the
+        # partner updates too, otherwise every agent updates once in random
+        # order. The pairs are inherently sequential, so this is a plain loop
+        # over Python floats with all random draws made up front.
+        n = self.number_of_agents
+        extremism_range = self.extremism_range
+        if self.extremism_type == "two side":
+            extremist = lambda x: 0.5 - abs(x - 0.5) < extremism_range
+        elif self.extremism_type == "one side":
+            extremist = lambda x: x < extremism_range
+        else:
+            extremist = lambda x: False
+
+        for r in range(self.n_replicates):
+            rng = self.rngs[r]
+            if self.original:
+                agents = rng.integers(n, size=n)
+            else:
+                agents = rng.permutation(n)
+            partners = rng.integers(n, size=n)
+
+            opinion = self.opinion[r].tolist()
+            eps = self.eps[r].tolist()
+
+            for i, p in zip(agents.tolist(), partners.tolist()):
+                x = opinion[i]
+                if extremist(x) or not abs(x - opinion[p]) < eps[i]:
+                    continue
+                x = (x + opinion[p]) / 2
+                opinion[i] = x
+                if self.original:
+                    y = opinion[p]
+                    if not extremist(y) and abs(y - x) < eps[p]:
+                        opinion[p] = (y + x) / 2
+
+            self.opinion[r] = opinion
+
+    def report_opinions(self, replicate=0):
+        # "[opinion] of turtles" in NetLogo comes back in random order
+        return self.opinion[replicate][self.rngs[replicate].permutation(self.number_of_agents)]
+
+def run_model_with_parameters(parameters, ticks=1, seed=None):
+    # Same contract as bc_model.run_model_with_parameters. NetLogo's 'go' is
+    # called once there, hence the default of a single tick.
+    engine = BoundedConfidenceEngine(parameters, seed=seed)
+    with phase('setup'):
+        engine.setup()
+    with phase('go'):
+        engine.run(ticks)
+    note(ticks=ticks)
+
+    opinions = engine.report_opinions()
+    data = {"[opinion] of turtles": opinions}
+    data_frame = pd.DataFrame(data)
+
+    return data_frame
+
+def run_replicates(parameters, seed, ticks=1):
+    # All replicates of a parameter set in one batched run, seed holding one
+    # seed per replicate. Rows of every replicate carry its index.
+    engine = BoundedConfidenceEngine(parameters, n_replicates=len(seed), seed=list(seed))
+    with phase('setup'):
+        engine.setup()
+    with phase('go'):
+        engine.run(ticks)
+    note(ticks=ticks)
+
+    frames = [pd.DataFrame({"[opinion] of turtles": engine.report_opinions(r), "replicate": r})
+              for r in range(len(seed))]
+    return pd.concat(frames, ignore_index=True)
@@ -1,30 +1,20 @@
-from fastdtw import fastdtw
-from scipy.spatial.distance import euclidean
-from functools import partial
 import numpy as np
 import pandas as pd
 
-from bc_model import run_model_with_parameters
+from dtw import dtw, dtw_batch
+from instrument import phase
 
-def my_metric(x, y, model_std, *args, **kwargs):
-    model_median = np.median(x)
-    model_mean = np.mean(x)
-    if (abs(model_median - y) <= model_std).any() or (abs(model_mean - y) <= model_std).any():
-        return 0
-    else:
-        return abs(x - y)
-
-def error(predictions, target_df):
-    model_data = predictions
-    
-    if isinstance(target_df, pd.DataFrame): 
-        target_data = target_df.values.ravel()
-    else:
-        target_data = target_df.ravel()
+def error(predictions, target_df, band=None):
+    # Accepts arrays, Series and single-column DataFrames alike
+    model_data = np.asarray(predictions, dtype=float).ravel()
+    target_data = np.asarray(target_df, dtype=float).ravel()
 
     # x is model data, y is target data
-    distance, _ = fastdtw(model_data, target_data, dist=partial(my_metric, model_std=np.std(model_data)))
-    
-    return distance
-
+    with phase('dtw'):
+        return dtw(model_data, target_data, tolerance=np.std(model_data), band=band)
 
+def error_batch(predictions_list, target_df, band=None):
+    # Errors of many model outputs against one target in a single DTW pass
+    model_data = [np.asarray(predictions, dtype=float).ravel() for predictions in predictions_list]
+    target_data = np.asarray(target_df, dtype=float).ravel()
+    return dtw_batch(model_data, target_data, [np.std(x) for x in model_data], band=band)
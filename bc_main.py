@@ -1,12 +1,16 @@
+import argparse
 import pandas as pd
-from sklearn.model_selection import RandomizedSearchCV
 import numpy as np
 from functools import reduce
 
-from bc_optimise import MyModel
+from bc_optimise import MyModel, fidelity
 from bc_custom_cv import CustomCV
 from bc_plot_fit import plot_fit
 from bc_error import error
+from search_cv import FoldSharedSearchCV, SuccessiveHalvingSearchCV, SurrogateSearchCV
+from work_queue import WorkQueue
+from memory_scheduler import get_scheduler
+from plot_batch import render_top, report
 
 import os
 os.chdir(os.path.dirname(os.path.realpath(__file__)))
@@ -19,39 +23,83 @@ def load_data(filepath):
 def custom_discrete(low, high, step):
     return list(np.arange(low, high, step))
 
+# Define the parameter distributions
+param_grid = {
+    "original": [True, False],
+    "communication_regime": ["HK (select all)", "DW (select one)"],
+    "number_of_agents": custom_discrete(200, 1001, 200),
+    "extremism_range": custom_discrete(0.0, 0.11, 0.01),
+    "extremism_type": ["one side", "two side"],
+    "alpha": custom_discrete(0.01, 6.1, 0.1),
+    "beta": custom_discrete(0.01, 6.1, 0.1),
+    "entry_exit_rate": custom_discrete(0.0, 0.11, 0.02),
+    "min_eps": custom_discrete(0.0, 0.51, 0.05),
+    "max_eps": custom_discrete(0.5, 1.01, 0.05)
+}
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--search', choices=['surrogate', 'random', 'halving'], default='surrogate',
+                        help="surrogate-model search (default), random sampling or successive halving")
+    parser.add_argument('--n-iter', type=int, default=5, help="number of simulated candidates")
+    parser.add_argument('--replicates', type=int, default=1,
+                        help="runs per candidate with common seeds; scores are their mean")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="seed of the runs; only seeded runs are cached and plotted with --plot-top")
+    parser.add_argument('--engine', default='netlogo', help="netlogo, or the in-process numpy engine")
+    parser.add_argument('--data', default='random_data.csv', help="CSV file with the target in its last column")
+    parser.add_argument('--journal', help="SQLite file recording every trial; rerun with it to resume")
+    parser.add_argument('--workers', metavar='HOST:PORT',
+                        help="evaluate on work_queue.py workers connecting to this address instead of local processes")
+    parser.add_argument('--plot-top', type=int, default=0, metavar='K',
+                        help="save the fits of the K best candidates from the simulation cache (no extra runs)")
+    parser.add_argument('--plot-dir', default='fits', help="directory for --plot-top figures")
+    parser.add_argument('--plot-format', choices=['png', 'svg', 'pdf'], default='png')
+    args = parser.parse_args()
+
     # Load your training data
-    y_train = load_data('random_data.csv').iloc[:, -1] # <class 'pandas.core.frame.DataFrame'>
+    y_train = load_data(args.data).iloc[:, -1] # <class 'pandas.core.frame.DataFrame'>
 
     # Split your training data into X and y
     X_train = np.ones((y_train.shape[0], 1)) # If you don't have separate input data
 
-    model = MyModel()
-
-    # Define the parameter distributions
-    param_grid = {
-        "original": [True, False],
-        "communication_regime": ["HK (select all)", "DW (select one)"],
-        "number_of_agents": custom_discrete(200, 1001, 200),
-        "extremism_range": custom_discrete(0.0, 0.11, 0.01),
-        "extremism_type": ["one side", "two side"],
-        "alpha": custom_discrete(0.01, 6.1, 0.1),
-        "beta": custom_discrete(0.01, 6.1, 0.1),
-        "entry_exit_rate": custom_discrete(0.0, 0.11, 0.02),
-        "min_eps": custom_discrete(0.0, 0.51, 0.05),
-        "max_eps": custom_discrete(0.5, 1.01, 0.05)
-    }
+    # --engine numpy runs the in-process NumPy model instead of NetLogo
+    model = MyModel(engine=args.engine, seed=args.seed, n_replicates=args.replicates)
 
     grid_size = reduce(lambda x, y: x * len(y), param_grid.values(), 1)
     #print(f"Size of the search space: {grid_size}")
 
-    random_search = RandomizedSearchCV(model, param_distributions=param_grid,
-                                   cv=CustomCV(n_splits=2),
-                                   verbose=3, n_jobs=-1, n_iter=5)
+    # Both searches simulate every candidate only once and score all CV folds
+    # from that single run. The surrogate search proposes batches of candidates
+    # (one per worker) from a model of the scores seen so far; random sampling
+    # works like RandomizedSearchCV. Successive halving screens n_iter
+    # candidates at low fidelity and promotes the best third twice.
+    # As many local workers as the memory budget holds with the largest runs
+    n_jobs = get_scheduler().max_workers('bc', param_grid)
+
+    # Start workers with: python work_queue.py worker HOST:PORT
+    executor = WorkQueue(args.workers, verbose=1) if args.workers else None
+    if args.search == 'halving':
+        random_search = SuccessiveHalvingSearchCV(model, param_distributions=param_grid, fidelity=fidelity,
+                                                  cv=CustomCV(n_splits=2),
+                                                  verbose=3, n_jobs=n_jobs, n_iter=args.n_iter,
+                                                  journal=args.journal, executor=executor)
+    else:
+        search = SurrogateSearchCV if args.search == 'surrogate' else FoldSharedSearchCV
+        random_search = search(model, param_distributions=param_grid,
+                               cv=CustomCV(n_splits=2),
+                               verbose=3, n_jobs=n_jobs, n_iter=args.n_iter,
+                               journal=args.journal, executor=executor)
     random_search.fit(X_train, y_train)
+    if executor is not None:
+        executor.close()
+
+    if args.plot_top:
+        report(render_top('bc', model, random_search.cv_results_, X_train, y_train, k=args.plot_top,
+                          directory=args.plot_dir, fmt=args.plot_format, n_jobs=n_jobs))
 
     # Load your validation data
-    y_val = load_data('random_data.csv').iloc[:, -1] # or random_data_validation.csv
+    y_val = load_data(args.data).iloc[:, -1] # or random_data_validation.csv
 
     # Use the best model to make predictions on the validation data
     best_model = random_search.best_estimator_
@@ -62,9 +110,11 @@ if __name__ == '__main__':
     error_value = error(predictions, y_val)
 
     print(f"error_value: {error_value}")
+    print(f"candidates per CPU-hour: {random_search.throughput_['candidates_per_cpu_hour']:.1f}")
 
     # Retrieve the and plot best estimator
     plot_fit(X_train, y_train, random_search.best_estimator_,
+             predictions = predictions,
              error = error_value,
              params = random_search.best_params_)
     print(random_search.best_params_)
\ No newline at end of file
@@ -1,39 +1,50 @@
-import pynetlogo
 import pandas as pd
 import numpy as np
 
-def run_model_with_parameters(parameters):
-
-    # Start a NetLogo instance
-    netlogo = pynetlogo.NetLogoLink(gui=False)
-
-    # Load your model
-    netlogo.load_model('bc_6_3.nlogo')
-
-    # Set input parameters
-    netlogo.command(f'set original {str(parameters["original"]).lower()}')
-    netlogo.command(f'set communication_regime "{parameters["communication_regime"]}"')
-    netlogo.command(f'set number_of_agents {parameters["number_of_agents"]}')
-    netlogo.command(f'set extremism_range {parameters["extremism_range"]}')
-    netlogo.command(f'set alpha {float(parameters["alpha"])}')
-    netlogo.command(f'set beta {parameters["beta"]}')
-    netlogo.command(f'set entry_exit_rate {parameters["entry_exit_rate"]}')
-    netlogo.command(f'set min_eps {parameters["min_eps"]}')
-    netlogo.command(f'set max_eps {parameters["max_eps"]}')
-    netlogo.command(f'set extremism_type "{parameters["extremism_type"]}"')
-
-    # Setup the model
-    netlogo.command('setup')
-
-    # Run the model with 'go' button which is a forever button
-    netlogo.command('go')
-
-    # Gather the output as a pandas dataframe
-    opinions = np.array(netlogo.report('[opinion] of turtles'))
-    data = {"[opinion] of turtles": opinions}
-    data_frame = pd.DataFrame(data)
-
-    # Remember to kill the link when you're done
-    netlogo.kill_workspace()
+from instrument import note, phase
+from memory_scheduler import admit
+from netlogo_pool import lease
+
+def run_model_with_parameters(parameters, seed=None, headless=True, ticks=1):
+
+    # Wait until the run fits in the host's memory budget, then lease a
+    # NetLogo instance with the model already loaded from this process' pool
+    # instead of starting a new one for every run
+    with admit('bc', parameters) as run, lease('bc_6_3.nlogo', jvmargs=run.jvmargs) as netlogo:
+
+        # Set input parameters
+        netlogo.command(f'set original {str(parameters["original"]).lower()}')
+        netlogo.command(f'set communication_regime "{parameters["communication_regime"]}"')
+        netlogo.command(f'set number_of_agents {parameters["number_of_agents"]}')
+        netlogo.command(f'set extremism_range {parameters["extremism_range"]}')
+        netlogo.command(f'set alpha {float(parameters["alpha"])}')
+        netlogo.command(f'set beta {parameters["beta"]}')
+        netlogo.command(f'set entry_exit_rate {parameters["entry_exit_rate"]}')
+        netlogo.command(f'set min_eps {parameters["min_eps"]}')
+        netlogo.command(f'set max_eps {parameters["max_eps"]}')
+        netlogo.command(f'set extremism_type "{parameters["extremism_type"]}"')
+        # No drawing, plotting or colouring: only the opinions are used
+        netlogo.command(f'set headless {str(headless).lower()}')
+
+        # Seed NetLogo's random generator for a reproducible run
+        if seed is not None:
+            netlogo.command(f'random-seed {int(seed)}')
+
+        # Setup the model (clear-all in setup resets the previous run)
+        with phase('setup'):
+            netlogo.command('setup')
+
+        # Run the model with 'go' button which is a forever button
+        with phase('go'):
+            netlogo.command(f'repeat {int(ticks)} [ go ]')
+        note(ticks=ticks)
+
+        # Gather the output as a pandas dataframe
+        with phase('report'):
+            opinions = np.array(netlogo.report('[opinion] of turtles'))
+        data = {"[opinion] of turtles": opinions}
+        data_frame = pd.DataFrame(data)
+
+    # The workspace goes back to the pool when leaving the with block
 
     return data_frame
@@ -1,10 +1,39 @@
+import os
+import numpy as np
 from sklearn.base import BaseEstimator, RegressorMixin
 
 from bc_model import run_model_with_parameters
+from bc_engine import run_model_with_parameters as run_engine_with_parameters, run_replicates
 from bc_error import error
+from search_cv import replicate_seeds
+from instrument import evaluation, phase
+from sim_cache import get_cache
+
+# Backends that can simulate a parameter set: the NetLogo model through
+# pynetlogo or the in-process NumPy engine (no JVM needed)
+ENGINES = {
+    'netlogo': run_model_with_parameters,
+    'numpy': run_engine_with_parameters
+}
+
+# Files whose content determines the output of each backend (cache key)
+HERE = os.path.dirname(os.path.realpath(__file__))
+SOURCES = {
+    'netlogo': [os.path.join(HERE, 'bc_6_3.nlogo'), os.path.join(HERE, 'bc_model.py')],
+    'numpy': [os.path.join(HERE, 'bc_engine.py')]
+}
+
+def fidelity(parameters, resource):
+    # Cheaper version of a parameter set for successive halving: the same
+    # model with a share `resource` of the agents (bc runs a single tick, so
+    # the agent count is what the run time depends on)
+    parameters = dict(parameters)
+    if 'number_of_agents' in parameters:
+        parameters['number_of_agents'] = max(20, int(round(parameters['number_of_agents'] * resource)))
+    return parameters
 
 class MyModel(BaseEstimator, RegressorMixin):
-    def __init__(self, original = "false", communication_regime = "HK (select all)", number_of_agents=50, extremism_range=0.1, extremism_type="one side", alpha=1, beta=1, entry_exit_rate=0.1, min_eps=0.1, max_eps=0.9):
+    def __init__(self, original = "false", communication_regime = "HK (select all)", number_of_agents=50, extremism_range=0.1, extremism_type="one side", alpha=1, beta=1, entry_exit_rate=0.1, min_eps=0.1, max_eps=0.9, engine="netlogo", seed=None, cache=True, n_replicates=1):
         self.original = original
         self.communication_regime = communication_regime
         self.number_of_agents = number_of_agents
@@ -15,6 +44,10 @@ class MyModel(BaseEstimator, RegressorMixin):
         self.entry_exit_rate = entry_exit_rate
         self.min_eps = min_eps
         self.max_eps = max_eps
+        self.engine = engine
+        self.seed = seed
+        self.cache = cache
+        self.n_replicates = n_replicates
         self.parameters = {
             'original': self.original,
             'communication_regime': self.communication_regime,
@@ -42,17 +75,41 @@ class MyModel(BaseEstimator, RegressorMixin):
             'min_eps': self.min_eps,
             'max_eps': self.max_eps
         }
+        # Runs of the previous parameters are not runs of these
+        for name in ('replicate_predictions_', 'predictions_'):
+            self.__dict__.pop(name, None)
 
         return self
 
+    def _simulate(self, run_func, sources, seed):
+        if self.cache:
+            # Reuse the output of an earlier run with the same inputs, if any
+            return get_cache().run(run_func, sources, self.parameters, seed)
+        return run_func(self.parameters, seed=seed)
+
     def predict(self, X):
-        self.predictions_ = run_model_with_parameters(self.parameters)
+        # One run per replicate (see replicate_seeds); the numpy engine runs
+        # them all at once along its replicate axis
+        seeds = replicate_seeds(self.seed, self.n_replicates)
+        with evaluation(self.parameters, engine=self.engine), phase('predict'):
+            if self.engine == 'numpy' and self.n_replicates > 1:
+                batch = self._simulate(run_replicates, SOURCES['numpy'], seeds)
+                self.replicate_predictions_ = [group.drop(columns='replicate').reset_index(drop=True)
+                                               for _, group in batch.groupby('replicate')]
+            else:
+                self.replicate_predictions_ = [self._simulate(ENGINES[self.engine], SOURCES[self.engine], seed)
+                                               for seed in seeds]
+        # predict returns the first replicate, scores use all of them
+        self.predictions_ = self.replicate_predictions_[0]
         return self.predictions_
 
+    def score_replicates(self, X, y):
+        if not hasattr(self, 'replicate_predictions_'):
+            self.predict(X)
+        # Note the negative sign because GridSearchCV tries to maximize the score
+        with evaluation(self.parameters, engine=self.engine), phase('score'):
+            return np.array([-error(predictions, y) for predictions in self.replicate_predictions_])
 
     def score(self, X, y):
-        if hasattr(self, 'predictions_'):
-            predictions = self.predictions_
-        else:
-            predictions = self.predict(X)
-        return -error(predictions, y) # Note the negative sign because GridSearchCV tries to maximize the score
+        # Mean over the replicates
+        return float(np.mean(self.score_replicates(X, y)))
@@ -3,8 +3,15 @@ import matplotlib.pyplot as plt
 import numpy as np
 from matplotlib import transforms
 
-def plot_fit(X, y, model, error=None, params=None):
-    predictions = model.predict(X).values.ravel()
+def plot_fit(X, y, model=None, error=None, params=None, predictions=None, filename=None):
+    # predictions: output of an earlier model.predict (or the model's last
+    # one), so plotting doesn't simulate again. filename: save the figure
+    # there instead of showing it
+    if predictions is None:
+        predictions = getattr(model, 'predictions_', None)
+    if predictions is None:
+        predictions = model.predict(X)
+    predictions = np.asarray(predictions).ravel()
     y = y.values.ravel()  # Assuming y is a dataframe, convert it to numpy array
 
     # Original time axes
@@ -37,4 +44,8 @@ def plot_fit(X, y, model, error=None, params=None):
                        verticalalignment='top', bbox=props)
     
     plt.legend()
-    plt.show()
+    if filename is not None:
+        plt.savefig(filename, bbox_inches='tight')
+        plt.close()
+    else:
+        plt.show()
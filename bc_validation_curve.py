@@ -1,37 +1,23 @@
+import argparse
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 import os
-from tqdm import tqdm
 from bc_optimise import MyModel
-from bc_custom_cv import CustomCV
-from sklearn.model_selection import KFold
 from bc_error import error
+from validation_curve import report, validation_curve
 
 def load_data(filepath):
     # Load data
     data = pd.read_csv(filepath)
     return data
 
-def custom_cross_val_score(model, X, y, cv, error_func, params):
-    kf = KFold(n_splits=cv)
-    scores = []
-
-    for train_index, test_index in kf.split(X):
-        X_train, X_test = X[train_index], X[test_index]
-        y_train, y_test = y[train_index], y[test_index]
-
-        model.set_params(**params)
-        model.fit(X_train, y_train)
-
-        # Since your model generates the entire time-series prediction from parameters,
-        # we do not need to use X_test and y_test for prediction, just for error calculation.
-        score = error_func(params, y_test)
-        scores.append(score)
-
-    return np.array(scores)
-
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--replicates', type=int, default=1,
+                        help="runs of the parameter set; fold errors are their mean")
+    parser.add_argument('--n-jobs', type=int, default=-1, help="split counts scored in parallel")
+    args = parser.parse_args()
+
     # Define the path to data file
     filepath = 'random_data_training.csv'
 
@@ -48,15 +34,11 @@ if __name__ == '__main__':
     # Split your training data into X and y
     X_train = np.ones((y_train.shape[0], 1))  # If you don't have separate input data
 
-    model = MyModel()
+    model = MyModel(n_replicates=args.replicates)
 
     # Define a range for n_splits
     n_splits_range = list(range(2, 12))
 
-    # List to store the mean cross-validated score for each value of n_splits
-    cv_scores_mean = []
-    cv_scores_std = []
-
     # Params for the model, found through some parameter optimisation
 
     # (Hyperparameter tuning (as finding n_splits) aims to optimize
@@ -78,32 +60,9 @@ if __name__ == '__main__':
     }
 
 
-    # Loop over n_splits_range and for each value, perform cross-validation and then compute the mean score
-    for n_splits in tqdm(n_splits_range):
-        cv_scores = custom_cross_val_score(model, X_train, y_train, cv=n_splits, error_func=error, params=params)
-        cv_scores_mean.append(np.mean(cv_scores))
-        cv_scores_std.append(np.std(cv_scores))
-
-    cv_scores_mean = np.array(cv_scores_mean)
-    cv_scores_std = np.array(cv_scores_std)
-
-    # Plot the validation curve
-    plt.figure(figsize=(10, 6))
-    plt.plot(n_splits_range, cv_scores_mean, color='blue', marker='o', markersize=5, label='mean cross-validated error')
-    plt.fill_between(n_splits_range, cv_scores_mean - cv_scores_std, cv_scores_mean + cv_scores_std, alpha=0.15, color='blue')
-    plt.title('Validation curve')
-    plt.xlabel('n_splits')
-    plt.ylabel('Cross-validated error')
-    plt.grid()
-    plt.legend(loc='upper right')
-
-    min_mean_idx = np.argmin(cv_scores_mean) # Find index where mean score is minimum
-    optimal_n_splits = n_splits_range[min_mean_idx] # Find the n_splits value corresponding to this index
-    std_at_min_mean = cv_scores_std[min_mean_idx] # Fetch the standard deviation corresponding to this minimum mean
-    
-    print(f"The optimal number of splits is: {optimal_n_splits}")
-    print(f"The error at this split is: {cv_scores_mean[min_mean_idx]}")
-    print(f"The standard deviation at this split is: {std_at_min_mean}")
-    
-    plt.show()
+    # Simulate the parameter set once and score the folds of every n_splits
+    # value against the same predictions
+    cv_scores_mean, cv_scores_std, _ = validation_curve(model, params, X_train, y_train, error,
+                                                        n_splits_range, n_jobs=args.n_jobs)
 
+    report(n_splits_range, cv_scores_mean, cv_scores_std)
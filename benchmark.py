@@ -0,0 +1,299 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+# Offline benchmarks of the fitting pipeline: error functions, the cd culture
+# file harvest, the in-process engines and a whole search with a stubbed
+# simulator (no NetLogo or JVM needed for any of them). The netlogo/ cases
+# compare the models' headless mode with the full GUI output and are skipped
+# where pynetlogo is missing or the JVM can't be started. Results are written
+# as JSON; given a baseline file from an earlier run, cases whose median time
+# grew by more than the tolerance are flagged and the exit status is 1.
+#
+#   python benchmark.py --output before.json
+#   python benchmark.py --output after.json --baseline before.json
+
+BENCHMARKS = {}
+
+class Skip(Exception):
+    # Raised by a case's setup when it can't run here
+    pass
+
+def benchmark(name):
+    # Register a case: the decorated function does the setup and returns the
+    # callable that is timed
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+def synthetic_history(n_ticks, n_agents, F, seed=0):
+    # Culture history that settles like a real run: fewer agents change each tick
+    rng = np.random.default_rng(seed)
+    history = np.empty((n_ticks, n_agents, F), dtype=np.int8)
+    history[0] = rng.integers(0, 5, size=(n_agents, F))
+    for t in range(1, n_ticks):
+        history[t] = history[t - 1]
+        changing = rng.random(n_agents) < 0.5 / t
+        history[t, changing] = rng.integers(0, 5, size=(changing.sum(), F))
+    return history
+
+def target_series(length=100, seed=1):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(np.sort(rng.beta(5, 2, length)))
+
+# Error functions
+
+def _bc_error_case(n_agents):
+    def setup():
+        from bc_error import error
+        predictions = pd.DataFrame({"[opinion] of turtles": np.random.default_rng(0).random(n_agents)})
+        target = target_series()
+        return lambda: error(predictions, target)
+    return setup
+
+for _n in (200, 1000, 5000):
+    benchmark(f'bc_error/agents={_n}')(_bc_error_case(_n))
+
+def _cd_error_case(n_ticks, F):
+    def setup():
+        from cd_engine import history_to_df
+        from cd_error import error
+        predictions = history_to_df(synthetic_history(n_ticks, 225, F))
+        target = target_series()
+        return lambda: error(predictions, target)
+    return setup
+
+for _ticks in (100, 500):
+    for _F in (2, 8, 15):
+        benchmark(f'cd_error/ticks={_ticks}/F={_F}')(_cd_error_case(_ticks, _F))
+
+# cd_model harvest: read a culture file as NetLogo writes it and build the frame
+
+def _harvest_case(n_ticks, n_agents, F):
+    def setup():
+        from cd_engine import history_to_df
+        from cd_model import read_culture_file
+        history = synthetic_history(n_ticks, n_agents, F)
+        records = np.full((n_ticks, n_agents, F + 1), ord('\n'), dtype=np.uint8)
+        records[:, :, :F] = history + ord('0')
+        fd, filename = tempfile.mkstemp(suffix='.bin')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(records.tobytes())
+
+        def run():
+            return history_to_df(read_culture_file(filename, n_agents, F))
+        run.cleanup = lambda: os.remove(filename)
+        return run
+    return setup
+
+for _ticks, _agents in ((100, 225), (500, 900)):
+    benchmark(f'cd_harvest/ticks={_ticks}/agents={_agents}')(_harvest_case(_ticks, _agents, 8))
+
+# cd_analytics: cultures, regions and giant component of every tick
+
+def _analytics_case(n_ticks, size):
+    def setup():
+        from cd_analytics import analytics
+        from cd_engine import history_to_df
+        rng = np.random.default_rng(0)
+        positions = rng.random((n_ticks, size * size, 2)) * size - 0.5
+        predictions = history_to_df(synthetic_history(n_ticks, size * size, 5), positions=positions)
+        parameters = dict(CD_PARAMETERS, world_size_x=size, world_size_y=size)
+        return lambda: analytics(predictions, parameters)
+    return setup
+
+for _ticks, _size in ((100, 15), (500, 30)):
+    benchmark(f'cd_analytics/ticks={_ticks}/agents={_size * _size}')(_analytics_case(_ticks, _size))
+
+# In-process engines
+
+BC_PARAMETERS = {
+    'original': False, 'communication_regime': 'HK (select all)', 'number_of_agents': 200,
+    'extremism_range': 0.05, 'extremism_type': 'one side', 'alpha': 2.0, 'beta': 2.0,
+    'entry_exit_rate': 0.02, 'min_eps': 0.1, 'max_eps': 0.6
+}
+
+CD_PARAMETERS = {
+    'world_size_x': 10, 'world_size_y': 10, 'F': 5, 'radius': 1.5,
+    'veloc': 0.5, 'steplength': 0.5, 'angle': 20
+}
+
+def _bc_engine_case(regime, n_agents):
+    def setup():
+        from bc_engine import run_model_with_parameters
+        parameters = dict(BC_PARAMETERS, communication_regime=regime, number_of_agents=n_agents)
+        return lambda: run_model_with_parameters(parameters, seed=0)
+    return setup
+
+for _regime, _label in (('HK (select all)', 'HK'), ('DW (select one)', 'DW')):
+    for _n in (200, 1000, 5000):
+        benchmark(f'bc_engine/{_label}/agents={_n}')(_bc_engine_case(_regime, _n))
+
+def _cd_engine_case(size):
+    def setup():
+        from cd_engine import run_model_with_parameters
+        parameters = dict(CD_PARAMETERS, world_size_x=size, world_size_y=size)
+        return lambda: run_model_with_parameters(parameters, seed=0, max_ticks=50)
+    return setup
+
+for _size in (10, 20):
+    benchmark(f'cd_engine/world={_size}/ticks<=50')(_cd_engine_case(_size))
+
+def _vm_case(n_replicates, clusters, tied=False, size=151):
+    def setup():
+        from vm_model import run_model_with_parameters
+        parameters = {'clusters': clusters, 'change_vote_if_tied': tied, 'world_width': size, 'world_height': size}
+        return lambda: run_model_with_parameters(parameters, n_replicates=n_replicates, seed=0, max_ticks=50)
+    return setup
+
+for _replicates in (1, 16):
+    benchmark(f'vm_model/random/replicates={_replicates}')(_vm_case(_replicates, False))
+benchmark('vm_model/clusters/replicates=16')(_vm_case(16, True))
+# Tied patches flip for ever: runs end on the detected period-2 cycle
+benchmark('vm_model/tied/world=301/replicates=4')(_vm_case(4, False, tied=True, size=301))
+
+# End-to-end search over the bc_main / cd_main parameter grids with a stub
+# in place of the simulator, so the search, CV and scoring overhead is timed
+
+def stub_bc(parameters, seed=None):
+    rng = np.random.default_rng(seed)
+    n = int(parameters['number_of_agents'])
+    return pd.DataFrame({"[opinion] of turtles": rng.beta(parameters['alpha'], parameters['beta'], n)})
+
+def stub_cd(parameters, seed=None, **kwargs):
+    from cd_engine import history_to_df
+    n_agents = int(parameters['world_size_x']) * int(parameters['world_size_y'])
+    return history_to_df(synthetic_history(60, n_agents, int(parameters['F']), seed=seed or 0))
+
+def _search_case(model_name, search_name):
+    def setup():
+        if model_name == 'bc':
+            import bc_optimise as optimise
+            from bc_main import param_grid
+            optimise.ENGINES['stub'], optimise.SOURCES['stub'] = stub_bc, [__file__]
+        else:
+            import cd_optimise as optimise
+            from cd_main import param_grid
+            optimise.ENGINES['stub'], optimise.SOURCES['stub'] = stub_cd, [__file__]
+        import search_cv
+        search = getattr(search_cv, search_name)
+        y = target_series()[0]
+        X = np.ones((len(y), 1))
+        model = optimise.MyModel(engine='stub', seed=0, cache=False)
+        return lambda: search(model, param_grid, n_iter=16, cv=2, n_jobs=1, random_state=0).fit(X, y)
+    return setup
+
+for _model in ('bc', 'cd'):
+    for _search in ('FoldSharedSearchCV', 'SurrogateSearchCV'):
+        benchmark(f'search/{_model}/{_search}')(_search_case(_model, _search))
+
+# NetLogo runs with and without the headless switch (drawing, plots, colours)
+
+def _netlogo_case(model_name, parameters, headless, **kwargs):
+    def setup():
+        # Only a missing pynetlogo/JPype or a JVM that won't start skip the
+        # case; errors of the models themselves are reported
+        try:
+            from netlogo_pool import NetLogoUnavailable
+            if model_name == 'bc':
+                from bc_model import run_model_with_parameters
+            else:
+                from cd_model import run_model_with_parameters
+        except ImportError as e:
+            raise Skip(f"NetLogo not available: {e!r}")
+        try:
+            run_model_with_parameters(parameters, seed=0, headless=headless, **kwargs)
+        except NetLogoUnavailable as e:
+            raise Skip(str(e))
+        return lambda: run_model_with_parameters(parameters, seed=0, headless=headless, **kwargs)
+    return setup
+
+for _headless in (False, True):
+    benchmark(f'netlogo/bc/agents=1000/headless={_headless}')(_netlogo_case('bc', dict(BC_PARAMETERS, number_of_agents=1000), _headless))
+    benchmark(f'netlogo/bc/agents=200/ticks=100/headless={_headless}')(_netlogo_case('bc', BC_PARAMETERS, _headless, ticks=100))
+    benchmark(f'netlogo/cd/world=15/headless={_headless}')(_netlogo_case('cd', dict(CD_PARAMETERS, world_size_x=15, world_size_y=15), _headless))
+
+def time_case(setup, repeat):
+    run = setup()
+    run()  # warm up (imports, caches, JVM)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    if hasattr(run, 'cleanup'):
+        run.cleanup()
+    return {'min': min(times), 'median': float(np.median(times)), 'repeat': repeat}
+
+def compare(results, baseline, tolerance):
+    # Cases whose median got slower than the baseline by more than tolerance
+    slower = {}
+    for name, result in results.items():
+        before = baseline.get('results', {}).get(name)
+        if before is not None and result['median'] > before['median'] * (1 + tolerance):
+            slower[name] = result['median'] / before['median']
+    return slower
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the fitting pipeline")
+    parser.add_argument('--output', default='benchmark_results.json', help="where to write the results (JSON)")
+    parser.add_argument('--baseline', help="earlier results to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed relative slowdown (default 0.2)")
+    parser.add_argument('--repeat', type=int, default=5, help="timed runs per case")
+    parser.add_argument('--filter', default='', help="only run cases whose name contains this")
+    parser.add_argument('--list', action='store_true', help="list the cases and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        print('\n'.join(BENCHMARKS))
+        return 0
+
+    # The main modules chdir to the repository on import
+    output = os.path.abspath(args.output)
+    baseline = None
+    if args.baseline:
+        with open(os.path.abspath(args.baseline)) as f:
+            baseline = json.load(f)
+    sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if args.filter in name:
+            try:
+                results[name] = time_case(setup, args.repeat)
+            except Skip as e:
+                print(f"{name:<50} skipped ({e})")
+                continue
+            print(f"{name:<50} median {results[name]['median'] * 1000:10.2f} ms   min {results[name]['min'] * 1000:10.2f} ms")
+
+    with open(output, 'w') as f:
+        json.dump({
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'results': results
+        }, f, indent=2)
+    print(f"Results written to {output}")
+
+    if baseline is not None:
+        slower = compare(results, baseline, args.tolerance)
+        for name, ratio in slower.items():
+            print(f"SLOWER: {name} takes {ratio:.2f}x the baseline time")
+        if slower:
+            return 1
+        print(f"No case slower than the baseline by more than {args.tolerance:.0%}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
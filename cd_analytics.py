@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from cd_error import culture_history
+
+# Per tick statistics of a recorded cd run, computed in Python from the
+# snapshots instead of in NetLogo: the number of distinct cultures (what
+# count-cultures plots), the number of cultural regions and the size of the
+# largest one (what count-turtles-on-bigger-region reports at the end). A
+# region is a set of agents with the same culture connected through pairs
+# within `radius` of each other on the torus, like the links of
+# creates-links-with-same-cultural-neighbours-in-neighborhood-of-radio-radius.
+# Cultures are encoded as integers in base q and counted with a sort; regions
+# come from the radius pairs of a periodic k-d tree over many ticks at once
+# (the tick is a third coordinate far enough apart to never pair) and a
+# vectorised union-find. Regions need the agent positions, which the runs
+# record with positions=True (MyModel does that when such targets are set).
+
+# Ticks per k-d tree are chosen to hold about this many agents
+MAX_POINTS = 2_000_000
+
+def culture_codes(history):
+    # One integer per culture (base q, q one more than the largest trait);
+    # cultures that don't fit in 63 bits get dense codes from np.unique
+    history = np.asarray(history)
+    F = history.shape[-1]
+    q = max(2, int(history.max()) + 1) if history.size else 2
+    if F * np.log2(q) < 63:
+        powers = q ** np.arange(F - 1, -1, -1, dtype=np.int64)
+        return history.astype(np.int64) @ powers
+    _, codes = np.unique(history.reshape(-1, F), axis=0, return_inverse=True)
+    return codes.reshape(history.shape[:-1]).astype(np.int64)
+
+def count_cultures(codes):
+    # Distinct cultures per tick of a (ticks x agents) code array
+    ordered = np.sort(codes, axis=1)
+    return 1 + (ordered[:, 1:] != ordered[:, :-1]).sum(axis=1)
+
+def union_find(n, a, b):
+    # Component label (smallest member) of n nodes joined by the pairs (a, b).
+    # Every round hooks the larger root of each pair under the smaller one and
+    # then compresses all paths, until both ends of every pair share a root.
+    parent = np.arange(n)
+    while True:
+        ra, rb = parent[a], parent[b]
+        unjoined = ra != rb
+        if not unjoined.any():
+            return parent
+        np.minimum.at(parent, np.maximum(ra, rb)[unjoined], np.minimum(ra, rb)[unjoined])
+        while True:
+            grandparent = parent[parent]
+            if (grandparent == parent).all():
+                break
+            parent = grandparent
+
+def region_statistics(codes, positions, radius, world_size_x, world_size_y):
+    # Regions and largest region size per tick of (ticks x agents) codes and
+    # (ticks x agents x 2) positions (world coordinates from -0.5)
+    n_ticks, n_agents = codes.shape
+    world = np.array([world_size_x, world_size_y], dtype=float)
+    regions = np.zeros(n_ticks, dtype=int)
+    giant = np.zeros(n_ticks, dtype=int)
+    chunk = max(1, MAX_POINTS // max(n_agents, 1))
+    for start in range(0, n_ticks, chunk):
+        stop = min(start + chunk, n_ticks)
+        ticks = stop - start
+        points = np.empty((ticks * n_agents, 3))
+        xy = (positions[start:stop].reshape(-1, 2) + 0.5) % world
+        points[:, :2] = np.where(xy >= world, 0, xy)  # -1e-17 % world == world
+        # Ticks 2 * radius + 1 apart on a third axis that wraps far outside the data
+        spacing = 2 * radius + 1
+        points[:, 2] = np.repeat(np.arange(ticks), n_agents) * spacing
+        tree = cKDTree(points, boxsize=np.append(world, (ticks + 1) * spacing))
+        pairs = tree.query_pairs(radius, output_type='ndarray')
+        chunk_codes = codes[start:stop].ravel()
+        pairs = pairs[chunk_codes[pairs[:, 0]] == chunk_codes[pairs[:, 1]]]
+
+        labels = union_find(len(points), pairs[:, 0], pairs[:, 1])
+        roots = np.flatnonzero(labels == np.arange(len(points)))
+        sizes = np.bincount(labels, minlength=len(points))[roots]
+        root_ticks = roots // n_agents
+        regions[start:stop] = np.bincount(root_ticks, minlength=ticks)
+        np.maximum.at(giant[start:stop], root_ticks, sizes)
+    return regions, giant
+
+def run_positions(predictions, n_ticks, n_agents):
+    # (ticks x agents x 2) positions of a run recorded with positions=True
+    if not isinstance(predictions, pd.DataFrame) or 'xcor' not in predictions.columns:
+        raise ValueError("cultural regions need a run recorded with positions=True")
+    return predictions[['xcor', 'ycor']].to_numpy().reshape(n_ticks, n_agents, 2)
+
+def analytics(predictions, parameters, regions=True):
+    # Frame with tick, cultures, regions and giant_component per recorded
+    # tick; parameters of the run give radius and world size. regions=False
+    # only counts cultures (and works without positions).
+    history = culture_history(predictions)
+    if not isinstance(history, np.ndarray):
+        raise ValueError("analytics needs the same agents at every tick")
+    n_ticks, n_agents, _ = history.shape
+    codes = culture_codes(history)
+    data = {'tick': np.arange(n_ticks), 'cultures': count_cultures(codes)}
+    if regions:
+        data['regions'], data['giant_component'] = region_statistics(
+            codes, run_positions(predictions, n_ticks, n_agents), float(parameters['radius']),
+            int(parameters['world_size_x']), int(parameters['world_size_y']))
+    return pd.DataFrame(data)
@@ -0,0 +1,231 @@
+import math
+import numpy as np
+import pandas as pd
+
+from instrument import note, phase
+
+# In-process re-implementation of cd_6_3.nlogo (Axelrod's cultural
+# dissemination with moving agents). Cultures are held as a dense
+# (agents x F) small-int array and the "other turtles in-radius radius"
+# queries are answered by a uniform grid that is updated as agents move.
+# The world wraps in both directions like the NetLogo model.
+
+# Default weights of the culture traits 0..4 (amount-culture-0..4 inputs)
+AMOUNT_CULTURE = (100, 100, 50, 50, 10)
+
+class UniformGrid:
+    # Buckets agents into square cells at least `radius` wide, so every
+    # neighbour within radius lies in the 3 x 3 block around an agent's cell
+    def __init__(self, positions, world_size_x, world_size_y, radius):
+        self.world = np.array([world_size_x, world_size_y], dtype=float)
+        self.n_cells = np.maximum(1, np.floor(self.world / max(radius, 1e-9))).astype(int)
+        self.cell_size = self.world / self.n_cells
+        self.radius = radius
+        self.positions = positions
+
+        nx, ny = self.n_cells
+        self.cells = [[] for _ in range(nx * ny)]
+        self.cell_of = np.empty(len(positions), dtype=int)
+        for agent in range(len(positions)):
+            cell = self._cell(positions[agent])
+            self.cell_of[agent] = cell
+            self.cells[cell].append(agent)
+
+        # The (wrapped, de-duplicated) 3 x 3 block of cells around every cell
+        self.block = []
+        for cx in range(nx):
+            for cy in range(ny):
+                block = {((cx + dx) % nx) * ny + (cy + dy) % ny
+                         for dx in (-1, 0, 1) for dy in (-1, 0, 1)}
+                self.block.append(sorted(block))
+
+        # With fewer than three cells along both axes every query touches all
+        # cells, so the bucket lists are skipped and all agents are checked
+        self.all_agents = np.arange(len(positions)) if nx * ny == len(self.block[0]) else None
+
+    def _cell(self, position):
+        # World coordinates run from -0.5 to size - 0.5
+        cx, cy = ((position + 0.5) // self.cell_size).astype(int) % self.n_cells
+        return cx * self.n_cells[1] + cy
+
+    def move(self, agent):
+        # Re-bucket a single agent after its position changed
+        cell = self._cell(self.positions[agent])
+        old = self.cell_of[agent]
+        if cell != old:
+            self.cells[old].remove(agent)
+            self.cells[cell].append(agent)
+            self.cell_of[agent] = cell
+
+    def neighbours(self, agent):
+        # Other agents within distance <= radius on the torus
+        if self.all_agents is not None:
+            candidates = self.all_agents
+        else:
+            candidates = np.array([other for cell in self.block[self.cell_of[agent]]
+                                   for other in self.cells[cell]])
+        delta = np.abs(self.positions[candidates] - self.positions[agent])
+        delta = np.minimum(delta, self.world - delta)
+        within = (delta * delta).sum(axis=1) <= self.radius * self.radius
+        within[candidates == agent] = False
+        return candidates[within]
+
+class CulturalDisseminationEngine:
+    def __init__(self, parameters, seed=None):
+        self.world_size_x = int(parameters["world_size_x"])
+        self.world_size_y = int(parameters["world_size_y"])
+        self.F = int(parameters["F"])
+        self.q = int(parameters.get("q", 4))
+        self.radius = float(parameters["radius"])
+        self.veloc = float(parameters["veloc"])
+        self.steplength = float(parameters["steplength"])
+        self.angle = int(parameters["angle"])
+        self.amount_culture = parameters.get("amount_culture", AMOUNT_CULTURE)
+        self.number_of_agents = self.world_size_x * self.world_size_y
+        self.rng = np.random.default_rng(seed)
+        self.seed = seed
+
+    def setup(self):
+        n = self.number_of_agents
+
+        # One agent per patch, placed on the patch centres in random order
+        patches = self.rng.permutation(n)
+        self.positions = np.column_stack((patches // self.world_size_y, patches % self.world_size_y)).astype(float)
+        self.heading = self.rng.integers(360, size=n).astype(float)
+
+        total_weight = sum(self.amount_culture)
+        if self.q == 4 and total_weight > 0:
+            # weighted-random in cd_6_3.nlogo: note it can draw trait 4 as well
+            probabilities = np.array(self.amount_culture, dtype=float) / total_weight
+            self.culture = self.rng.choice(len(probabilities), size=(n, self.F), p=probabilities).astype(np.int8)
+        else:
+            self.culture = self.rng.integers(self.q, size=(n, self.F), dtype=np.int8)
+
+        self.grid = UniformGrid(self.positions, self.world_size_x, self.world_size_y, self.radius)
+        self.ticks = 0
+        self.number_of_possible_interactions = 0
+        self.number_of_real_interactions = 0
+        return self
+
+    def random_move(self, agent, var):
+        # Rotate by var - (angle + 1) / 2, var being NetLogo's
+        # (random angle) + 1, i.e. in [-(angle - 1) / 2, (angle - 1) / 2]
+        # (+0.5 for angle 0), and step forward; the world wraps, so can-move?
+        # is always true
+        heading = self.heading[agent] + var - (self.angle + 1) / 2
+        self.heading[agent] = heading
+        theta = math.radians(heading)
+        x, y = self.positions[agent]
+        x = (x + self.steplength * math.sin(theta) + 0.5) % self.world_size_x - 0.5
+        y = (y + self.steplength * math.cos(theta) + 0.5) % self.world_size_y - 0.5
+        self.positions[agent] = (x, y)
+        self.grid.move(agent)
+
+    def go(self):
+        # One pass of 'ask turtles [...]' of the NetLogo go loop
+        n = self.number_of_agents
+        F = self.F
+        self.number_of_possible_interactions = 0
+        self.number_of_real_interactions = 0
+
+        # All random numbers of the tick are drawn up front
+        order = self.rng.permutation(n)
+        moves = self.rng.random(n) < self.veloc
+        # NetLogo's random 0 is 0
+        turns = (self.rng.integers(self.angle, size=n) if self.angle > 0 else np.zeros(n, dtype=np.int64)) + 1
+        picks = self.rng.random(n)
+        chances = self.rng.random(n)
+        traits = self.rng.integers(F, size=n)
+
+        culture = self.culture
+        for agent in order:
+            if moves[agent]:
+                self.random_move(agent, turns[agent])
+
+            neighbours = self.grid.neighbours(agent)
+            if len(neighbours) == 0:
+                continue
+            neighbour = neighbours[int(picks[agent] * len(neighbours))]
+
+            same = culture[agent] == culture[neighbour]
+            overlap = int(same.sum())
+            if 0 < overlap < F:
+                self.number_of_possible_interactions += 1
+                if chances[agent] < overlap / F:
+                    self.number_of_real_interactions += 1
+                    # First differing feature at or after a random start
+                    differing = np.flatnonzero(~same)
+                    later = differing[differing >= traits[agent]]
+                    trait = later[0] if len(later) else differing[0]
+                    culture[agent, trait] = culture[neighbour, trait]
+
+        self.ticks += 1
+        return self
+
+    def run(self, max_ticks=None, callback=None, positions=False):
+        # Like 'go' in cd_6_3.nlogo: repeat until a whole pass had no possible
+        # interaction and record the cultures (and with positions=True the
+        # agent positions) at tick 0 and after every tick.
+        # callback(culture) sees every recorded tick as it is produced and may
+        # raise to cut the run short.
+        history = [self.culture.copy()]
+        position_history = [self.positions.astype(np.float32)] if positions else None
+        if callback is not None:
+            callback(history[-1])
+        while True:
+            self.go()
+            history.append(self.culture.copy())
+            if positions:
+                position_history.append(self.positions.astype(np.float32))
+            if callback is not None:
+                callback(history[-1])
+            if self.number_of_possible_interactions == 0:
+                break
+            if max_ticks is not None and self.ticks >= max_ticks:
+                break
+        self.history = np.stack(history)
+        self.position_history = np.stack(position_history) if positions else None
+        return self
+
+def format_cultures(cultures):
+    # Render an (rows x F) int array as NetLogo list strings like "[1 0 3 2]"
+    rows, F = cultures.shape
+    if F == 0 or cultures.min() < 0 or cultures.max() > 9:
+        return ['[' + ' '.join(str(v) for v in row) + ']' for row in cultures]
+
+    # Single digit traits: build the fixed-width byte strings in one go
+    chars = np.full((rows, 2 * F + 1), ord(' '), dtype=np.uint8)
+    chars[:, 0] = ord('[')
+    chars[:, -1] = ord(']')
+    chars[:, 1:-1:2] = cultures + ord('0')
+    return chars.view(f'S{2 * F + 1}').ravel().astype(str)
+
+def history_to_df(history, numeric=False, positions=None):
+    # Same layout as cd_model: one row per turtle and tick. With numeric=True
+    # the culture strings are replaced by int8 culture_0, culture_1, ...
+    # columns, which cd_error reads without any parsing. positions (ticks x
+    # agents x 2) add xcor and ycor columns (for cd_analytics).
+    n_ticks, n_agents, F = history.shape
+    cultures = history.reshape(n_ticks * n_agents, F)
+    if numeric:
+        data = {f'culture_{i}': cultures[:, i] for i in range(F)}
+    else:
+        data = {'culture': format_cultures(cultures)}
+    data['tick'] = np.repeat(np.arange(n_ticks), n_agents)
+    data['turtle_id'] = np.tile(np.arange(n_agents), n_ticks)
+    if positions is not None:
+        positions = np.asarray(positions, dtype=np.float32).reshape(n_ticks * n_agents, 2)
+        data['xcor'] = positions[:, 0]
+        data['ycor'] = positions[:, 1]
+    return pd.DataFrame(data)
+
+def run_model_with_parameters(parameters, seed=None, max_ticks=None, callback=None, positions=False):
+    # Same contract as cd_model.run_model_with_parameters
+    engine = CulturalDisseminationEngine(parameters, seed=seed)
+    with phase('setup'):
+        engine.setup()
+    with phase('go'):
+        engine.run(max_ticks, callback, positions)
+    note(ticks=engine.ticks)
+    with phase('to_frame'):
+        return history_to_df(engine.history, positions=engine.position_history)
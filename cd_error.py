@@ -1,20 +1,23 @@
-from scipy.spatial.distance import euclidean
-from functools import partial
 import numpy as np
 import pandas as pd
 from fastdtw import fastdtw
 from numpy.linalg import norm
-from itertools import groupby
+
+from dtw import IncrementalDTW, dtw, lower_bound
+from instrument import phase
+
+# Relative slack when comparing bounds with the best distance, so rounding
+# in the bounds can never prune a feature that fastdtw would rank first
+PRUNE_TOLERANCE = 1e-9
 
 def remove_trailing_duplicates(lst):
-    # Reverse and group by consecutive duplicate elements
-    grouped = [(key, list(group)) for key, group in groupby(lst[::-1])]
-    
-    # Take only one from each group
-    cleaned = [g[0] for g in grouped]
-    
-    # Reverse again to get the desired list
-    return cleaned[::-1]
+    # Keep one element of every run of consecutive duplicates
+    values = np.asarray(lst)
+    if len(values) == 0:
+        return values
+    keep = np.ones(len(values), dtype=bool)
+    keep[1:] = values[1:] != values[:-1]
+    return values[keep]
 
 # To do:
 # - take individual culture values, erase stagnant values out - done
@@ -26,59 +29,159 @@ def remove_trailing_duplicates(lst):
 def my_euclidean(x, y):
     return norm(x - y)
 
+def parse_cultures(strings):
+    # NetLogo list strings like "[1 0 3 2]" to an (rows x F) int8 array.
+    # Both backends write single digit traits, so every string has the same
+    # width and the digits sit at fixed byte offsets; anything else goes
+    # through one bulk split of the joined column.
+    strings = np.asarray(strings)
+    if len(strings) == 0:
+        return np.zeros((0, 0), dtype=np.int8)
+
+    raw = strings.astype('S')
+    width = raw.dtype.itemsize
+    chars = raw.view(np.uint8).reshape(len(raw), width)
+    if width >= 3 and width % 2 == 1:
+        digits = chars[:, 1:-1:2]
+        if ((chars[:, 0] == ord('[')).all() and (chars[:, -1] == ord(']')).all()
+                and (chars[:, 2:-1:2] == ord(' ')).all()
+                and ((digits >= ord('0')) & (digits <= ord('9'))).all()):
+            return np.subtract(digits, ord('0'), dtype=np.int8)
+
+    text = b' '.join(raw).replace(b'[', b' ').replace(b']', b' ')
+    return np.array(text.split(), dtype=np.int8).reshape(len(raw), -1)
+
+def culture_array(predictions):
+    # (rows x F) traits and the tick of every row. Numeric sources skip string
+    # parsing: an engine history array (ticks x agents x F) or a frame with
+    # culture_0, culture_1, ... columns.
+    if isinstance(predictions, np.ndarray):
+        n_ticks, n_agents, F = predictions.shape
+        return predictions.reshape(-1, F), np.repeat(np.arange(n_ticks), n_agents)
+
+    ticks = predictions['tick'].to_numpy()
+    numeric = [c for c in predictions.columns if str(c).startswith('culture_')]
+    if numeric:
+        numeric.sort(key=lambda c: int(str(c)[len('culture_'):]))
+        return predictions[numeric].to_numpy(), ticks
+    return parse_cultures(predictions['culture'].to_numpy()), ticks
+
+def culture_history(predictions):
+    # Run as a (ticks x agents x F) int8 array, the most compact input of
+    # error(); predictions without the same agents every tick are returned as is
+    if isinstance(predictions, np.ndarray):
+        return predictions
+    values, ticks = culture_array(predictions)
+    unique_ticks, counts = np.unique(ticks, return_counts=True)
+    if (counts != counts[0]).any() or (np.diff(ticks) < 0).any():
+        return predictions
+    return np.asarray(values, dtype=np.int8).reshape(len(unique_ticks), counts[0], values.shape[1])
+
+def tick_statistics(values, ticks, scale=4.0):
+    # Per tick mean and (sample) std of every feature after dividing by scale,
+    # like groupby('tick').agg(['mean', 'std']) but with bincount reductions
+    unique_ticks, inverse = np.unique(ticks, return_inverse=True)
+    counts = np.bincount(inverse).astype(float)
+    values = np.asarray(values, dtype=float) / scale
+
+    means = np.empty((len(unique_ticks), values.shape[1]))
+    stds = np.empty_like(means)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for i in range(values.shape[1]):
+            sums = np.bincount(inverse, weights=values[:, i])
+            squares = np.bincount(inverse, weights=values[:, i] ** 2)
+            means[:, i] = sums / counts
+            variance = np.maximum(squares - sums * means[:, i], 0) / (counts - 1)
+            stds[:, i] = np.where(counts > 1, np.sqrt(variance), np.nan)
+    return unique_ticks, means, stds
+
 def transform_df(data, column_name = 'culture'):
-    # Step 1: Convert string representation of lists to actual lists
-    data[column_name] = data[column_name].apply(
-        lambda x: [int(i) for i in x[1:-1].split()])
-    
-    # Step 2: Create a new DataFrame with separate columns
-    new_data = pd.DataFrame(data[column_name].to_list())
-    
-    # Step 3: Set Column Names
-    new_data.columns = ['culture_' + str(i) for i in new_data.columns]
-    
-    return new_data
-
-def error(predictions, target_df):
-    # Extract and transform predictions into workable data frame
-    model_data = pd.concat([
-        transform_df(predictions['culture'].to_frame(), 'culture'),
-        predictions['tick'].to_frame()
-        ], axis=1)
-
-    # Step 2: Normalize the Data
-    model_data.iloc[:, :-1] = model_data.iloc[:, :-1] / 4.0
-
-    model_data = model_data.groupby('tick').agg(
-        {col: ['mean', 'std'] for col in model_data.columns[:-1]}
-    ).reset_index()
-
-    # Flatten the MultiIndex columns and add '_mean' and '_std' suffixes
-    model_data.columns = ['tick'] + [
-        f'{col}_{agg_func}' for col, agg_func in model_data.columns[1:]
-    ]
-
-    if isinstance(target_df, pd.DataFrame): # make fit for single parameter run or receiving data frame
-        target_data = target_df.values.ravel()
-    else:
-        target_data = target_df.ravel()
-
-    distances = []
-
-    # List of columns with '_mean' in their name
-    mean_columns = [col for col in model_data.columns if '_mean' in col]
-
-    # Number of such columns
-    num_columns = len(mean_columns)
-
-    for i in range(num_columns):
-        # Compute the DTW distance
-        x_mean = model_data[f'culture_{i}_mean'].values.ravel()
-        x_mean = remove_trailing_duplicates(x_mean)
-
-        distance, _ = fastdtw(target_data, x_mean, dist=my_euclidean)
-        
-        # Add the computed distance to the total distance
-        distances.append(distance)
-
-    return min(distances)
\ No newline at end of file
+    # Culture strings to a frame with one culture_i column per feature
+    values = parse_cultures(data[column_name].to_numpy())
+    return pd.DataFrame(values, columns=['culture_' + str(i) for i in range(values.shape[1])])
+
+def aggregate(predictions):
+    # Per tick culture statistics as a frame with tick, culture_i_mean and
+    # culture_i_std columns (the layout error used to build with groupby)
+    ticks, means, stds = tick_statistics(*culture_array(predictions))
+    data = {'tick': ticks}
+    for i in range(means.shape[1]):
+        data[f'culture_{i}_mean'] = means[:, i]
+        data[f'culture_{i}_std'] = stds[:, i]
+    return pd.DataFrame(data)
+
+def analytics_error(predictions, targets, parameters):
+    # Sum of the exact DTW distances of cd_analytics series (cultures,
+    # regions, giant_component as shares of the agents) to their targets,
+    # e.g. {'regions': series}; parameters of the run give radius and size
+    from cd_analytics import analytics  # cd_analytics itself imports this module
+
+    stats = analytics(predictions, parameters, regions=bool(set(targets) - {'cultures'}))
+    n_agents = int(parameters['world_size_x']) * int(parameters['world_size_y'])
+    total = 0.0
+    for name, target in targets.items():
+        series = remove_trailing_duplicates(stats[name].to_numpy() / n_agents)
+        total += dtw(np.asarray(target, dtype=float).ravel(), series)
+    return total
+
+def error(predictions, target_df, analytics_targets=None, parameters=None):
+    # Per tick mean of every (normalised) culture feature; analytics_targets
+    # add the analytics_error of those series (parameters of the run needed)
+    with phase('parse'):
+        values, ticks = culture_array(predictions)
+    with phase('aggregate'):
+        _, means, _ = tick_statistics(values, ticks)
+
+    # make fit for single parameter run or receiving data frame
+    target_data = np.asarray(target_df, dtype=float).ravel()
+
+    # The error is the smallest fastdtw distance over all features (bc_error
+    # uses exact DTW, so the two models' errors are on different scales).
+    # fastdtw never beats exact DTW, which in turn never beats the cheap lower
+    # bounds, so features are tried in order of their bound and skipped as
+    # soon as a bound or an (early abandoned) exact DTW shows they can't win.
+    features = [remove_trailing_duplicates(means[:, i]) for i in range(means.shape[1])]
+    bounds = [lower_bound(target_data, x_mean) for x_mean in features]
+
+    best = np.inf
+    with phase('dtw'):
+        for i in np.argsort(bounds, kind='stable'):
+            limit = best * (1 + PRUNE_TOLERANCE)
+            if bounds[i] > limit:
+                break
+            if np.isfinite(best) and dtw(target_data, features[i], max_distance=limit) == np.inf:
+                continue
+
+            # Compute the DTW distance
+            distance, _ = fastdtw(target_data, features[i], dist=my_euclidean)
+            best = min(best, distance)
+
+    if analytics_targets:
+        with phase('analytics'):
+            best += analytics_error(predictions, analytics_targets, parameters)
+    return best
+
+class StreamingError:
+    # Lower bounds of error(predictions, target) for every target while the
+    # run is still going: update() takes the cultures of each new tick. The
+    # per-tick feature means are deduplicated like in error() and streamed
+    # into an incremental exact DTW per (target, feature); since fastdtw never
+    # beats exact DTW, the smallest bound over the features bounds the error.
+    def __init__(self, targets, F, scale=4.0):
+        self.targets = [np.asarray(target, dtype=float).ravel() for target in targets]
+        self.F = F
+        self.scale = scale
+        self.dtw = IncrementalDTW([target for target in self.targets for _ in range(F)])
+        self.last = None
+
+    def update(self, cultures):
+        means = np.asarray(cultures, dtype=float).mean(axis=0) / self.scale
+        changed = np.ones(self.F, dtype=bool) if self.last is None else means != self.last
+        if changed.any():
+            n = len(self.targets)
+            self.dtw.push(np.tile(means, n), np.tile(changed, n))
+            self.last = means
+        return self.bounds()
+
+    def bounds(self):
+        return self.dtw.lower_bound().reshape(len(self.targets), self.F).min(axis=1)
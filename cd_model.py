@@ -1,17 +1,68 @@
-import pynetlogo
-import pandas as pd
+import numpy as np
 import os
-
-def run_model_with_parameters(parameters):
-
-    # Start a NetLogo instance
-    netlogo = pynetlogo.NetLogoLink(gui=False, jvmargs=['-Xmx2G'])
-
-    # Load your model
-    netlogo.load_model('cd_6_3.nlogo')
+import atexit
+import shutil
+import tempfile
+import uuid
+
+from instrument import note, phase
+from memory_scheduler import admit
+from netlogo_pool import lease
+from cd_engine import history_to_df
+
+# Scratch directory of this worker process for the culture files
+_scratch_dir = None
+_scratch_pid = None
+
+def scratch_dir():
+    global _scratch_dir, _scratch_pid
+    if _scratch_dir is None or _scratch_pid != os.getpid():
+        _scratch_dir = tempfile.mkdtemp(prefix=f'cd_scratch_{os.getpid()}_')
+        _scratch_pid = os.getpid()
+        atexit.register(shutil.rmtree, _scratch_dir, ignore_errors=True)
+    return _scratch_dir
+
+def read_culture_file(filename, number_of_agents, F):
+    # The file holds, for every saved tick, one record of F ASCII digits and a
+    # newline per turtle (in who order). Memory-map it and view it as a
+    # (ticks x agents x F + 1) byte array; only the digit columns are used.
+    raw = np.memmap(filename, dtype=np.uint8, mode='r')
+    record_size = number_of_agents * (F + 1)
+    if raw.size == 0 or raw.size % record_size != 0:
+        raise ValueError(f"{filename} does not hold whole ticks of {number_of_agents} agents with F = {F}")
+    records = raw.reshape(-1, number_of_agents, F + 1)
+    if not (records[:, :, F] == ord('\n')).all():
+        raise ValueError(f"{filename} is not a fixed-width culture file (traits must be single digits)")
+
+    history = np.subtract(records[:, :, :F], ord('0'), dtype=np.int8)
+    del records, raw
+    return history
+
+def read_position_file(filename, number_of_agents):
+    # "xcor ycor" lines, one per turtle (in who order) for every saved tick,
+    # as a (ticks x agents x 2) float32 array
+    values = np.fromfile(filename, dtype=np.float64, sep=' ')
+    if values.size == 0 or values.size % (2 * number_of_agents) != 0:
+        raise ValueError(f"{filename} does not hold whole ticks of {number_of_agents} agent positions")
+    return values.astype(np.float32).reshape(-1, number_of_agents, 2)
+
+def run_model_with_parameters(parameters, seed=None, headless=True, positions=False):
+
+    # Wait until the run fits in the host's memory budget, then lease a
+    # NetLogo instance with the model already loaded from this process' pool
+    # instead of starting a new one for every run. The JVM heap is sized from
+    # the run's memory estimate.
+    with admit('cd', parameters) as run, lease('cd_6_3.nlogo', jvmargs=run.jvmargs) as netlogo:
+        df = run_in_workspace(netlogo, parameters, seed, headless, positions)
+        run.ticks = int(df['tick'].max())
+        return df
+
+def run_in_workspace(netlogo, parameters, seed=None, headless=True, positions=False):
 
     # Set input parameters
     netlogo.command(f'set saving {str(True).lower()}')
+    # No drawing, plotting or colouring: only the culture file is used
+    netlogo.command(f'set headless {str(headless).lower()}')
 
      # Set simuation parameters
     netlogo.command(f'set world-size-x {parameters["world_size_x"]}')
@@ -23,44 +74,46 @@ def run_model_with_parameters(parameters):
     netlogo.command(f'set steplength {parameters["steplength"]}')
     netlogo.command(f'set angle {parameters["angle"]}')
 
-    # Setup the model
-    netlogo.command('setup')
+    # setup draws the model's seed from NetLogo's random generator, so seeding
+    # that first makes the whole run reproducible
+    if seed is not None:
+        netlogo.command(f'random-seed {int(seed)}')
+
+    # Setup the model (clear-all in setup resets the previous run)
+    with phase('setup'):
+        netlogo.command('setup')
 
     # Get seed
     the_seed = int(netlogo.report('seed'))
 
-    # Run the model with 'go' button which is a forever button
-    netlogo.command('go')
-
-    # Fetch culture data from files saved by NetLogo
-    files = [os.path.join(f) for f in os.listdir() if f"culture_data_{the_seed}_" in f and f.endswith('.txt')]
-    assert files, "The 'files' list is empty!"
-    all_data = []
+    # Let NetLogo append the whole culture history to a single file in this
+    # worker's scratch directory (set after setup, clear-all resets globals)
+    filename = os.path.join(scratch_dir(), f'culture_data_{the_seed}_{uuid.uuid4().hex}.bin')
+    netlogo.command(f'set culture-file "{filename.replace(os.sep, "/")}"')
+    # Agent positions go to a second file (only needed for cd_analytics regions)
+    position_filename = filename[:-len('.bin')] + '_positions.txt' if positions else None
+    if positions:
+        netlogo.command(f'set position-file "{position_filename.replace(os.sep, "/")}"')
 
+    # Run the model with 'go' button which is a forever button
+    with phase('go'):
+        netlogo.command('go')
 
-    for filename in sorted(files):  # Sorting makes sure data is processed in order of ticks
+    # Fetch culture data from the file saved by NetLogo
+    with phase('harvest'):
+        number_of_agents = int(netlogo.report('count turtles'))
         try:
-            df_temp = pd.read_csv(filename, header=None, names=['culture'])
-            tick_num = int(filename.split('_')[3].replace('.txt', ''))  # filename structure: "culture_data_[seed]_[tick].txt"
-            df_temp['tick'] = tick_num
-            df_temp['turtle_id'] = df_temp.index
-            all_data.append(df_temp)
-            os.remove(filename)  # Delete the file after reading its content
-        except IndexError:
-            print(f"Error with filename: {filename}")
-            continue
-        except FileNotFoundError:
-            print(f"File {filename} does not exist!")
-            exit()
-
-    # if not all_data:
-    #     raise ValueError("No data files were read. Check the 'past runs' directory and file naming.")
-
-    df = pd.concat(all_data, ignore_index=True)
+            history = read_culture_file(filename, number_of_agents, int(parameters["F"]))
+            position_history = read_position_file(position_filename, number_of_agents) if positions else None
+        finally:
+            for name in (filename, position_filename):
+                if name is not None and os.path.exists(name):
+                    os.remove(name)  # Delete the file after reading its content
+    note(ticks=len(history) - 1, seed=the_seed)
 
-    # df.to_csv(f"past runs/culture_data_{the_seed}.csv", index=False)
+    with phase('to_frame'):
+        df = history_to_df(history, positions=position_history)
 
-    print(f"Created file for seed {the_seed}...")
-    netlogo.kill_workspace()
+    # df.to_csv(f"past runs/culture_data_{the_seed}.csv", index=False)
 
     return df
@@ -1,10 +1,41 @@
+import os
+import numpy as np
 from sklearn.base import BaseEstimator, RegressorMixin
 
 from cd_model import run_model_with_parameters
-from cd_error import error
+from cd_engine import run_model_with_parameters as run_engine_with_parameters
+from cd_error import StreamingError, error
+from search_cv import SimulationAbandoned, replicate_seeds
+from instrument import evaluation, phase
+from sim_cache import get_cache
+
+# Backends that can simulate a parameter set: the NetLogo model through
+# pynetlogo or the in-process Python engine (no JVM needed)
+ENGINES = {
+    'netlogo': run_model_with_parameters,
+    'python': run_engine_with_parameters
+}
+
+# Files whose content determines the output of each backend (cache key)
+HERE = os.path.dirname(os.path.realpath(__file__))
+SOURCES = {
+    'netlogo': [os.path.join(HERE, 'cd_6_3.nlogo'), os.path.join(HERE, 'cd_model.py')],
+    'python': [os.path.join(HERE, 'cd_engine.py')]
+}
+
+def fidelity(parameters, resource):
+    # Cheaper version of a parameter set for successive halving: a world with
+    # a share `resource` of the patches (one agent per patch). The run length
+    # is left alone since the DTW error compares the whole culture history.
+    parameters = dict(parameters)
+    scale = resource ** 0.5
+    for key in ('world_size_x', 'world_size_y'):
+        if key in parameters:
+            parameters[key] = max(5, int(round(parameters[key] * scale)))
+    return parameters
 
 class MyModel(BaseEstimator, RegressorMixin):
-    def __init__(self, world_size_x = 20, world_size_y = 20, F = 5, radius = 0.5, veloc = 1, steplength = 0.5, angle = 20, data_frame = None):
+    def __init__(self, world_size_x = 20, world_size_y = 20, F = 5, radius = 0.5, veloc = 1, steplength = 0.5, angle = 20, data_frame = None, engine = "netlogo", seed = None, cache = True, max_ticks = None, n_replicates = 1, analytics_targets = None):
         self.world_size_x = world_size_x
         self.world_size_y = world_size_y
         self.F = F
@@ -23,9 +54,22 @@ class MyModel(BaseEstimator, RegressorMixin):
         }
         # Store the data frame
         self.data_frame = data_frame
+        self.engine = engine
+        self.seed = seed
+        self.cache = cache
+        self.max_ticks = max_ticks
+        self.n_replicates = n_replicates
+        # Extra fitting targets computed from the run by cd_analytics, e.g.
+        # {'regions': series, 'giant_component': series} (shares of the agents)
+        self.analytics_targets = analytics_targets
 
 
-    def fit(self, X, y=None):
+    def fit(self, X, y=None, targets=None, abandon_above=None):
+        # targets/abandon_above (passed by the searches in search_cv with
+        # early_abandon=True): stop python engine runs as soon as their mean
+        # error over the targets is certain to exceed abandon_above
+        self.targets_ = targets
+        self.abandon_above_ = abandon_above
         self.parameters = {
             'world_size_x': self.world_size_x,
             'world_size_y': self.world_size_y,
@@ -35,15 +79,71 @@ class MyModel(BaseEstimator, RegressorMixin):
             'steplength': self.steplength,
             'angle': self.angle
         }
+        # Runs of the previous parameters are not runs of these
+        for name in ('replicate_predictions_', 'predictions_'):
+            self.__dict__.pop(name, None)
 
         return self
 
+    def _abandon_check(self):
+        # Per tick callback for the python engine that raises
+        # SimulationAbandoned once the run can't get below abandon_above
+        # (single runs only: with replicates one run's error says too little)
+        targets = getattr(self, 'targets_', None)
+        abandon_above = getattr(self, 'abandon_above_', None)
+        if targets is None or abandon_above is None or self.n_replicates > 1:
+            return None
+        streaming = StreamingError(targets, int(self.F))
+
+        def check(cultures):
+            bounds = streaming.update(cultures)
+            if bounds.mean() > abandon_above:
+                raise SimulationAbandoned(bounds)
+        return check
+
+    def _positions(self):
+        # Regions need the agent positions of every tick
+        return bool(set(self.analytics_targets or ()) - {'cultures'})
+
+    def _run(self, parameters, seed=None):
+        # NetLogo runs always go to the end; the python engine honours the
+        # tick budget and streams its ticks to the early-abandon check
+        if self.engine != 'python':
+            return ENGINES[self.engine](parameters, seed=seed, positions=self._positions())
+        return ENGINES['python'](parameters, seed=seed, max_ticks=self.max_ticks, callback=self._abandon_check(),
+                                 positions=self._positions())
+
     def predict(self, X):
-        if self.data_frame is None:
-            return run_model_with_parameters(self.parameters)
-        else:
-            return self.data_frame
+        if self.max_ticks is not None and self.engine != 'python':
+            raise ValueError("max_ticks needs engine='python'")
+        # A tick budget or recorded positions change the output, so they are part of the cache key
+        parameters = self.parameters if self.max_ticks is None else dict(self.parameters, max_ticks=self.max_ticks)
+        if self._positions():
+            parameters = dict(parameters, positions=True)
+
+        # Abandoned runs raise SimulationAbandoned and are never cached
+        with evaluation(self.parameters, engine=self.engine), phase('predict'):
+            if self.data_frame is not None:
+                self.replicate_predictions_ = [self.data_frame]
+            elif self.cache:
+                # Reuse the output of an earlier run with the same inputs, if any
+                self.replicate_predictions_ = [get_cache().run(self._run, SOURCES[self.engine], parameters, seed)
+                                               for seed in replicate_seeds(self.seed, self.n_replicates)]
+            else:
+                self.replicate_predictions_ = [self._run(parameters, seed=seed)
+                                               for seed in replicate_seeds(self.seed, self.n_replicates)]
+        # predict returns the first replicate, scores use all of them
+        self.predictions_ = self.replicate_predictions_[0]
+        return self.predictions_
+
+    def score_replicates(self, X, y):
+        if not hasattr(self, 'replicate_predictions_'):
+            self.predict(X)
+        # Note the negative sign because GridSearchCV tries to maximize the score
+        with evaluation(self.parameters, engine=self.engine), phase('score'):
+            return np.array([-error(predictions, y, self.analytics_targets, self.parameters)
+                             for predictions in self.replicate_predictions_])
 
     def score(self, X, y):
-        predictions = self.predict(X)
-        return -error(predictions, y) # Note the negative sign because GridSearchCV tries to maximize the score
+        # Mean over the replicates
+        return float(np.mean(self.score_replicates(X, y)))
@@ -0,0 +1,55 @@
+import argparse
+import pandas as pd
+import numpy as np
+import os
+from cd_optimise import MyModel
+from cd_error import culture_history, error
+from validation_curve import report, validation_curve
+
+def load_data(filepath):
+    # Load data
+    data = pd.read_csv(filepath)
+    return data
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--replicates', type=int, default=1,
+                        help="runs of the parameter set; fold errors are their mean")
+    parser.add_argument('--n-jobs', type=int, default=-1, help="split counts scored in parallel")
+    args = parser.parse_args()
+
+    # Define the path to data file
+    filepath = 'random_data.csv'
+
+    # Set working directory
+    os.chdir(os.path.dirname(os.path.realpath(__file__)))
+
+    # Load training data (last column, like cd_main.py)
+    y_train = load_data(filepath).iloc[:, -1].to_numpy()
+
+    # Split your training data into X and y
+    X_train = np.ones((y_train.shape[0], 1))  # If you don't have separate input data
+
+    model = MyModel(n_replicates=args.replicates)
+
+    # Define a range for n_splits
+    n_splits_range = list(range(2, 12))
+
+    # Params for the model, found through some parameter optimisation
+    params = {
+        "world_size_x": 10,
+        "world_size_y": 10,
+        "F": 5,
+        "radius": 1.5,
+        "veloc": 0.5,
+        "steplength": 0.5,
+        "angle": 20
+    }
+
+    # Simulate the parameter set once and score the folds of every n_splits
+    # value against the same predictions (as compact culture histories)
+    cv_scores_mean, cv_scores_std, _ = validation_curve(model, params, X_train, y_train, error,
+                                                        n_splits_range, n_jobs=args.n_jobs,
+                                                        prepare=culture_history)
+
+    report(n_splits_range, cv_scores_mean, cv_scores_std)
@@ -0,0 +1,156 @@
+import numpy as np
+
+# Exact dynamic time warping in NumPy, optionally restricted to a Sakoe-Chiba
+# band. The accumulated cost matrix is filled one target column at a time;
+# inside a column the recurrence D[i] = min(a[i], D[i - 1] + c[i]) is solved
+# with a prefix sum and np.minimum.accumulate, so every column costs a few
+# vectorised operations instead of a Python call per cell. Many model series
+# can be scored against one target at once by stacking them along a batch
+# axis (padded to a common length).
+
+def cost_matrix(x, y, tolerance=None):
+    # |x_i - y_j| for every pair of points. With a tolerance the cost is zero
+    # wherever the points are within it: that is the point metric bc_error
+    # used with fastdtw, whose median and mean of a single point x_i are x_i.
+    cost = np.abs(np.subtract.outer(np.asarray(x, dtype=float), np.asarray(y, dtype=float)))
+    if tolerance is not None:
+        cost[cost <= tolerance] = 0.0
+    return cost
+
+def _window(j, n_rows, m, band, rows):
+    # Rows of column j inside the Sakoe-Chiba band around the diagonal from
+    # (0, 0) to (n - 1, m - 1). The band is widened to at least the slope of
+    # that diagonal so a warping path always exists.
+    if band is None or m == 1:
+        return None
+    slope = (n_rows - 1) / (m - 1)
+    radius = np.maximum(band, np.ceil(slope))
+    centre = j * slope
+    return np.abs(rows[None, :] - centre[:, None]) <= radius[:, None]
+
+def advance(D, c, allowed=None):
+    # Accumulated costs of the next column from those of the previous one (D,
+    # None for the first column) and the column's point costs c, both
+    # (batch x rows). allowed masks the rows inside the band.
+    if D is None:
+        # Paths start in (0, 0)
+        a = np.full(c.shape, np.inf)
+        a[:, 0] = c[:, 0]
+    else:
+        # Arrive diagonally from (i - 1, j - 1) or horizontally from (i, j - 1)
+        a = c + np.minimum(D, np.concatenate((np.full((len(D), 1), np.inf), D[:, :-1]), axis=1))
+    if allowed is not None:
+        a[~allowed] = np.inf
+
+    # Vertical moves within the column: D[i] = C[i] + min_k<=i (a[k] - C[k])
+    prefix = np.cumsum(c, axis=1)
+    D = prefix + np.minimum.accumulate(a - prefix, axis=1)
+    if allowed is not None:
+        D[~allowed] = np.inf
+    return D
+
+def column_minimum(D, n_rows):
+    # Every path crosses every column and costs never decrease along a path,
+    # so the smallest accumulated cost of a column bounds the final distance
+    rows = np.arange(D.shape[1])
+    return np.where(rows[None, :] < np.asarray(n_rows)[:, None], D, np.inf).min(axis=1)
+
+def accumulate(column_cost, n_rows, m, band=None, max_distance=None):
+    # column_cost(j) gives the (batch x rows) costs of target point j and
+    # n_rows the length of every model series (rows past it are padding).
+    # Returns the DTW distance of every series; series whose distance is
+    # certain to exceed max_distance are abandoned early and get inf.
+    n_rows = np.asarray(n_rows)
+    batch = len(n_rows)
+    rows = np.arange(n_rows.max())
+    D = None
+
+    for j in range(m):
+        D = advance(D, column_cost(j), _window(j, n_rows, m, band, rows))
+        if max_distance is not None and (column_minimum(D, n_rows) > max_distance).all():
+            return np.full(batch, np.inf)
+
+    distances = D[np.arange(batch), n_rows - 1]
+    if max_distance is not None:
+        distances = np.where(distances > max_distance, np.inf, distances)
+    return distances
+
+def dtw_distance(cost, band=None, max_distance=None):
+    # DTW distance from a precomputed (n x m) cost matrix
+    cost = np.asarray(cost, dtype=float)
+    n, m = cost.shape
+    distances = accumulate(lambda j: cost[None, :, j], [n], m, band, max_distance)
+    return float(distances[0])
+
+def dtw(x, y, tolerance=None, band=None, max_distance=None):
+    # DTW distance between series x and y with the |x - y| point cost,
+    # optionally gated by a tolerance (see cost_matrix)
+    return dtw_distance(cost_matrix(x, y, tolerance), band, max_distance)
+
+def dtw_batch(xs, y, tolerances=None, band=None, max_distance=None):
+    # DTW distances of many series xs (possibly of different lengths) to one
+    # target y in a single pass. Costs are built column by column, so the
+    # full (series x rows x target) cost tensor is never held in memory.
+    y = np.asarray(y, dtype=float)
+    n_rows = np.array([len(x) for x in xs])
+    padded = np.zeros((len(xs), n_rows.max()))
+    for b, x in enumerate(xs):
+        padded[b, :len(x)] = x
+    if tolerances is not None:
+        tolerances = np.asarray(tolerances, dtype=float)[:, None]
+
+    def column_cost(j):
+        cost = np.abs(padded - y[j])
+        if tolerances is not None:
+            cost[cost <= tolerances] = 0.0
+        return cost
+
+    return accumulate(column_cost, n_rows, len(y), band, max_distance)
+
+# Lower bounds of the unconstrained DTW distance with the |x - y| point cost.
+# Both are O(n + m), so they can rule out candidates before any DTW is run.
+
+def lb_kim(x, y):
+    # The first and the last pair of points are on every warping path
+    bound = abs(x[0] - y[0])
+    if len(x) > 1 or len(y) > 1:
+        bound += abs(x[-1] - y[-1])
+    return bound
+
+def lb_keogh(x, y):
+    # Every point of x is matched at least once, and never closer than its
+    # distance to the envelope [min(y), max(y)] of the whole of y
+    x = np.asarray(x, dtype=float)
+    lower, upper = np.min(y), np.max(y)
+    return float(np.sum(np.maximum(lower - x, 0) + np.maximum(x - upper, 0)))
+
+def lower_bound(x, y):
+    # Tightest of the bounds above (they overlap, so they can't be added)
+    return max(lb_kim(x, y), lb_keogh(x, y), lb_keogh(y, x))
+
+class IncrementalDTW:
+    # Unconstrained DTW of fixed series against series that grow one point at
+    # a time, e.g. targets against the per-tick output of a running model.
+    # After every push lower_bound() bounds the final distances from below,
+    # however the streams continue.
+    def __init__(self, series):
+        self.n_rows = np.array([len(x) for x in series])
+        self.padded = np.zeros((len(series), self.n_rows.max()))
+        for b, x in enumerate(series):
+            self.padded[b, :len(x)] = x
+        self.D = None
+
+    def push(self, values, mask=None):
+        # Append values[b] to stream b (only where mask is true; the first
+        # push must cover every stream)
+        D = advance(self.D, np.abs(self.padded - np.asarray(values, dtype=float)[:, None]))
+        if mask is not None and self.D is not None:
+            D = np.where(np.asarray(mask)[:, None], D, self.D)
+        self.D = D
+
+    def lower_bound(self):
+        return column_minimum(self.D, self.n_rows)
+
+    def distance(self):
+        # DTW distances if the streams ended now
+        return self.D[np.arange(len(self.n_rows)), self.n_rows - 1]
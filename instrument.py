@@ -0,0 +1,179 @@
+import argparse
+import glob
+import json
+import os
+import socket
+import time
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import numpy as np
+
+from sim_cache import canonical, parameter_hash
+
+# Opt-in timing of the phases of every evaluation (JVM start, load_model,
+# setup, go, harvesting, parsing, DTW, ...). Set INSTRUMENT_DIR to a directory
+# to switch it on: every worker process then appends one JSON line per
+# evaluation to its own file there, holding wall time, CPU time and RSS of
+# each phase plus the parameter hash and tick count. Without INSTRUMENT_DIR
+# phase() and evaluation() do nothing.
+#
+#   INSTRUMENT_DIR=.instrument python bc_main.py
+#   python instrument.py report .instrument
+
+INSTRUMENT_DIR = os.environ.get('INSTRUMENT_DIR')
+
+_stack = []     # names of the open phases
+_record = None  # evaluation record being filled
+
+def enable(directory):
+    # Switch instrumentation on from code; worker processes started later
+    # inherit it through the environment
+    global INSTRUMENT_DIR
+    INSTRUMENT_DIR = os.environ['INSTRUMENT_DIR'] = directory
+
+def rss_mb():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError):
+        return None
+
+def peak_rss_mb():
+    # ru_maxrss is in kB on Linux (bytes on macOS)
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
+
+def _write(record):
+    os.makedirs(INSTRUMENT_DIR, exist_ok=True)
+    path = os.path.join(INSTRUMENT_DIR, f'{socket.gethostname()}-{os.getpid()}.jsonl')
+    with open(path, 'a') as f:
+        f.write(json.dumps(record, default=str) + '\n')
+
+@contextmanager
+def _phase(name):
+    _stack.append(name)
+    path = '/'.join(_stack)
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        _stack.pop()
+        entry = {'phase': path, 'wall': time.perf_counter() - wall, 'cpu': time.process_time() - cpu,
+                 'rss_mb': rss_mb(), 'peak_rss_mb': peak_rss_mb()}
+        if _record is not None:
+            _record['phases'].append(entry)
+        else:
+            _write(dict(entry, type='phase', pid=os.getpid(), time=time.time()))
+
+def phase(name):
+    # Time a block as a phase of the current evaluation; nested phases are
+    # named by their path, e.g. 'predict/go'
+    if INSTRUMENT_DIR is None:
+        return nullcontext()
+    return _phase(name)
+
+def note(**fields):
+    # Attach fields (e.g. ticks=...) to the current evaluation record
+    if INSTRUMENT_DIR is not None and _record is not None:
+        _record.update(canonical(fields))
+
+@contextmanager
+def _evaluation(parameters, fields):
+    global _record
+    outer = _record
+    _record = record = {
+        'type': 'evaluation', 'pid': os.getpid(), 'time': time.time(),
+        'parameter_hash': parameter_hash(parameters), 'parameters': canonical(parameters),
+        **canonical(fields), 'phases': []
+    }
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield
+    except BaseException as e:
+        record['error'] = repr(e)
+        raise
+    finally:
+        record.update(wall=time.perf_counter() - wall, cpu=time.process_time() - cpu,
+                      rss_mb=rss_mb(), peak_rss_mb=peak_rss_mb())
+        _record = outer
+        _write(record)
+
+def evaluation(parameters, **fields):
+    # One record per evaluated parameter set, written when the block ends.
+    # Inside an open evaluation this adds nothing: the outer record collects
+    # all phases (e.g. a search candidate around MyModel.predict).
+    if INSTRUMENT_DIR is None or _record is not None:
+        return nullcontext()
+    return _evaluation(parameters, fields)
+
+def load(directory):
+    records = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.jsonl'))):
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        pass  # line cut short by a killed worker
+    return records
+
+def summarise(records, percentiles=(50, 90, 99)):
+    # Per phase count, wall/CPU percentiles and totals, and largest peak RSS
+    samples = {}
+    for record in records:
+        phases = record.get('phases', []) if record.get('type') == 'evaluation' else [record]
+        if record.get('type') == 'evaluation':
+            phases = phases + [dict(record, phase='(evaluation)')]
+        for entry in phases:
+            samples.setdefault(entry['phase'], []).append(entry)
+
+    rows = []
+    for name, entries in sorted(samples.items()):
+        wall = np.array([e['wall'] for e in entries])
+        cpu = np.array([e['cpu'] for e in entries])
+        peaks = [e['peak_rss_mb'] for e in entries if e.get('peak_rss_mb') is not None]
+        row = {'phase': name, 'n': len(entries)}
+        for p in percentiles:
+            row[f'wall_p{p}'] = float(np.percentile(wall, p))
+        row['wall_total'] = float(wall.sum())
+        for p in percentiles:
+            row[f'cpu_p{p}'] = float(np.percentile(cpu, p))
+        row['cpu_total'] = float(cpu.sum())
+        row['peak_rss_mb'] = max(peaks) if peaks else None
+        rows.append(row)
+    return rows
+
+def report(directory):
+    records = load(directory)
+    evaluations = [r for r in records if r.get('type') == 'evaluation']
+    print(f"{len(evaluations)} evaluations from {len({r['pid'] for r in records})} processes in {directory}")
+    ticks = [r['ticks'] for r in evaluations if r.get('ticks') is not None]
+    if ticks:
+        print(f"ticks: median {np.median(ticks):g}, p90 {np.percentile(ticks, 90):g}, max {max(ticks):g}")
+
+    rows = summarise(records)
+    if not rows:
+        return
+    columns = list(rows[0])
+    width = max(len(row['phase']) for row in rows)
+    print(f"{'phase':<{width}} " + ' '.join(f'{c:>11}' for c in columns[1:]))
+    for row in rows:
+        cells = [f'{str(row[c]):>11}' if isinstance(row[c], int) or row[c] is None else f'{row[c]:>11.4g}'
+                 for c in columns[1:]]
+        print(f"{row['phase']:<{width}} " + ' '.join(cells))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Aggregate instrumentation records")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    report_parser = subparsers.add_parser('report', help="per-phase percentiles of all records")
+    report_parser.add_argument('directory', nargs='?', default=INSTRUMENT_DIR or '.instrument')
+    args = parser.parse_args()
+    report(args.directory)
@@ -0,0 +1,194 @@
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import socket
+import sqlite3
+import time
+
+import numpy as np
+
+from memory_scheduler import _alive
+from sim_cache import canonical, parameter_hash
+
+# SQLite journal of search trials. Every candidate is written when it starts
+# and again with its fold scores, timings and status when it completes, so a
+# search that crashes or is killed can be restarted and picks up where it
+# stopped: finished trials are read back, failed and interrupted ones are run
+# again. A trial still running in another live process on this host is left to
+# that process; processes on other hosts can't be checked, so resume a search
+# shared between hosts only once its other runs have stopped. The database is
+# in WAL mode and every process opens its own connection, so all joblib
+# workers can write to it at the same time.
+#
+#   python bc_main.py --journal search.db   (run again to resume)
+#   python journal.py search.db             (trials per search and status)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS trials (
+    search TEXT NOT NULL,
+    key TEXT NOT NULL,
+    params TEXT NOT NULL,
+    seed TEXT,
+    status TEXT NOT NULL,
+    scores TEXT,
+    replicate_scores TEXT,
+    fit_time REAL,
+    score_times TEXT,
+    cpu_time REAL,
+    abandoned INTEGER,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    pid INTEGER,
+    host TEXT,
+    started REAL,
+    finished REAL,
+    PRIMARY KEY (search, key)
+)
+'''
+
+def _digest(value):
+    # Stable stand-in for values JSON can't hold (frames, arrays, objects)
+    try:
+        return hashlib.sha256(pickle.dumps(value)).hexdigest()
+    except Exception:
+        return repr(value)
+
+def search_id(estimator, param_distributions, y, folds):
+    # Searches with the same estimator settings, space, target and folds share
+    # their trials; n_iter is left out so a resumed search may run longer
+    text = json.dumps({
+        'estimator': type(estimator).__name__,
+        'estimator_params': canonical(estimator.get_params(deep=False)),
+        'param_distributions': canonical(param_distributions),
+        'y': hashlib.sha256(np.ascontiguousarray(np.asarray(y, dtype=float)).tobytes()).hexdigest(),
+        'folds': [np.asarray(test).tolist() for test in folds]
+    }, sort_keys=True, default=_digest)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+def trial_key(params):
+    return parameter_hash(params)
+
+def _dumps(value):
+    return json.dumps(canonical(value.tolist() if isinstance(value, np.ndarray) else value))
+
+class TrialJournal:
+    def __init__(self, path, timeout=60):
+        self.path = path
+        self.timeout = timeout
+        self._connection = None
+        self._pid = None
+
+    @property
+    def connection(self):
+        # SQLite connections must not cross fork(), so one per process
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.execute(SCHEMA)
+            # Journals written before trials recorded their host
+            columns = [row[1] for row in self._connection.execute('PRAGMA table_info(trials)')]
+            if 'host' not in columns:
+                self._connection.execute('ALTER TABLE trials ADD COLUMN host TEXT')
+            self._pid = os.getpid()
+        return self._connection
+
+    def start(self, search, key, params, seed=None):
+        self.connection.execute('''
+            INSERT INTO trials (search, key, params, seed, status, attempts, pid, host, started)
+            VALUES (?, ?, ?, ?, 'running', 1, ?, ?, ?)
+            ON CONFLICT (search, key) DO UPDATE SET
+                status = 'running', attempts = attempts + 1, pid = excluded.pid, host = excluded.host,
+                started = excluded.started
+        ''', (search, key, _dumps(params), json.dumps(canonical(seed)), os.getpid(), socket.gethostname(),
+              time.time()))
+
+    def record(self, search, key, result, error=None):
+        # Candidates that could not be scored on every fold count as failed
+        failed = not result['abandoned'] and not np.isfinite(result['scores']).all()
+        replicate_scores = result.get('replicate_scores')
+        self.connection.execute('''
+            UPDATE trials SET status = ?, scores = ?, replicate_scores = ?, fit_time = ?,
+                score_times = ?, cpu_time = ?, abandoned = ?, error = ?, finished = ?
+            WHERE search = ? AND key = ?
+        ''', ('failed' if failed else 'finished', _dumps(result['scores']),
+              None if replicate_scores is None else _dumps(replicate_scores),
+              result['fit_time'], _dumps(result['score_times']), result['cpu_time'],
+              int(result['abandoned']), error, time.time(), search, key))
+
+    def _result(self, row):
+        params, scores, replicate_scores, fit_time, score_times, cpu_time, abandoned = row
+        return {
+            'params': json.loads(params),
+            'scores': np.array(json.loads(scores), dtype=float),
+            'replicate_scores': None if replicate_scores is None else np.array(json.loads(replicate_scores), dtype=float),
+            'fit_time': fit_time,
+            'score_times': np.array(json.loads(score_times), dtype=float),
+            'cpu_time': cpu_time,
+            'abandoned': bool(abandoned)
+        }
+
+    def get(self, search, key):
+        # Result of a finished trial, None otherwise
+        row = self.connection.execute('''
+            SELECT params, scores, replicate_scores, fit_time, score_times, cpu_time, abandoned
+            FROM trials WHERE search = ? AND key = ? AND status = 'finished'
+        ''', (search, key)).fetchone()
+        return None if row is None else self._result(row)
+
+    def finished(self, search):
+        # Results of all finished trials in order of completion
+        rows = self.connection.execute('''
+            SELECT params, scores, replicate_scores, fit_time, score_times, cpu_time, abandoned
+            FROM trials WHERE search = ? AND status = 'finished' ORDER BY finished
+        ''', (search,)).fetchall()
+        return [self._result(row) for row in rows]
+
+    def _running_elsewhere(self, status, pid, host):
+        # Trial started by another process on this host that is still alive
+        return (status == 'running' and host == socket.gethostname() and pid is not None
+                and pid != os.getpid() and _alive(pid))
+
+    def in_progress(self, search):
+        # Keys of the trials other live processes on this host are running
+        rows = self.connection.execute('''
+            SELECT key, status, pid, host FROM trials WHERE search = ? AND status = 'running'
+        ''', (search,)).fetchall()
+        return {key for key, *run in rows if self._running_elsewhere(*run)}
+
+    def unfinished(self, search):
+        # Parameters of failed and interrupted ('running' without a live run
+        # on this host) trials
+        rows = self.connection.execute('''
+            SELECT params, status, pid, host FROM trials WHERE search = ? AND status != 'finished'
+            ORDER BY started
+        ''', (search,)).fetchall()
+        return [json.loads(params) for params, *run in rows if not self._running_elsewhere(*run)]
+
+    def summary(self):
+        return self.connection.execute('''
+            SELECT search, status, COUNT(*), MAX(attempts) FROM trials GROUP BY search, status ORDER BY search
+        ''').fetchall()
+
+    def close(self):
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        self._connection = None
+
+# One journal object per path and process, reused by the workers
+_journals = {}
+
+def get_journal(path):
+    journal = _journals.get(path)
+    if journal is None:
+        journal = _journals[path] = TrialJournal(path)
+    return journal
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Trials per search and status")
+    parser.add_argument('path')
+    args = parser.parse_args()
+    for search, status, count, attempts in get_journal(args.path).summary():
+        print(f"{search[:12]}  {status:<9} {count:6d} trials  (at most {attempts} attempts)")
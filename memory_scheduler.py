@@ -0,0 +1,298 @@
+import getpass
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import numpy as np
+
+from instrument import rss_mb
+
+# Memory-aware admission of NetLogo runs. Every run estimates the memory of
+# its worker process (JVM, model state, culture history, output frame) from
+# its parameters, corrected by the footprints measured in earlier runs, and
+# waits until that fits in the memory budget next to what the other workers
+# on this host have reserved. The reservations live in a small ledger file
+# shared by all processes of the host; a worker that is between runs keeps
+# its measured footprint (its JVM stays loaded) reserved. The JVM heap (-Xmx)
+# is sized from the same estimate instead of a fixed constant.
+#
+#   MEMORY_BUDGET_MB   budget for all workers of the host (default 80% of RAM)
+#   MEMORY_LEDGER      ledger file (default in the temp directory)
+#   MEMORY_HISTORY     measured footprints (default .memory_history.jsonl),
+#                      the last HISTORY_RUNS runs of each model
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+_user = os.getuid() if hasattr(os, 'getuid') else getpass.getuser()
+MEMORY_LEDGER = os.environ.get('MEMORY_LEDGER', os.path.join(tempfile.gettempdir(), f'od_memory_ledger_{_user}.json'))
+MEMORY_HISTORY = os.environ.get('MEMORY_HISTORY', os.path.join(HERE, '.memory_history.jsonl'))
+
+JVM_BASE_MB = 350     # JVM with NetLogo headless and a model loaded
+HEAP_BASE_MB = 128    # NetLogo's own heap use before any agents exist
+HEAP_MIN_MB = 512     # smallest -Xmx handed out (NetLogo's compiler needs some)
+HEAP_STEP_MB = 256    # -Xmx is rounded up to a multiple of this
+DEFAULT_TICKS = {'bc': 1, 'cd': 1000}
+HISTORY_RUNS = 1000   # measured runs kept per model
+HEAP_SIMILAR = 2      # runs within this factor of agents count as the same size
+
+def total_memory_mb():
+    try:
+        with open('/proc/meminfo') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemTotal:'):
+                    return int(line.split()[1]) / 2 ** 10
+    except OSError:
+        pass
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / 2 ** 20
+    except (AttributeError, ValueError, OSError):
+        return 4096  # unknown (Windows): set MEMORY_BUDGET_MB there
+
+def default_budget_mb():
+    budget = os.environ.get('MEMORY_BUDGET_MB')
+    return float(budget) if budget else 0.8 * total_memory_mb()
+
+def features(model, parameters):
+    # Size of a run: agents, traits per agent and run length (if known)
+    if model == 'cd':
+        agents = int(parameters['world_size_x']) * int(parameters['world_size_y'])
+        return {'agents': agents, 'F': int(parameters['F']), 'ticks': parameters.get('max_ticks')}
+    return {'agents': int(parameters['number_of_agents']), 'F': 1, 'ticks': 1}
+
+def static_heap_mb(model, agents, F, ticks):
+    # NetLogo heap: a turtle (and for cd its patch) is about 1 kB, list items
+    # (culture traits) 32 bytes each
+    per_agent = 2048 + 32 * F if model == 'cd' else 1024
+    return HEAP_BASE_MB + agents * per_agent / 2 ** 20
+
+def static_run_mb(model, agents, F, ticks):
+    # Python side of cd runs: the memory-mapped culture file, its int8 copy
+    # and the frame of one culture string per agent and tick
+    history = ticks * agents * ((F + 1) + F + (56 + F)) / 2 ** 20 if model == 'cd' else 0
+    return JVM_BASE_MB + static_heap_mb(model, agents, F, ticks) + history
+
+def recent(records, n=HISTORY_RUNS):
+    # The last n records of every model, in their order
+    counts = {}
+    kept = []
+    for record in reversed(records):
+        counts[record['model']] = counts.get(record['model'], 0) + 1
+        if counts[record['model']] <= n:
+            kept.append(record)
+    return kept[::-1]
+
+class MemoryModel:
+    # Static estimates scaled by how far off they were in earlier runs
+    def __init__(self, path=MEMORY_HISTORY):
+        self.path = path
+        self.records = []
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        self.records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        pass  # line cut short by a killed worker
+            n_lines = len(self.records)
+            self.records = recent(self.records)
+            if n_lines > 2 * len(self.records):
+                self._compact()
+
+    def _compact(self):
+        # Rewrite the history with the kept records only. Runs appended by
+        # other workers since it was read are lost, which only costs a
+        # little of the history.
+        tmp = f'{self.path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                f.writelines(json.dumps(record) + '\n' for record in self.records)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+    def _records(self, model):
+        return [r for r in self.records if r['model'] == model]
+
+    def expected_ticks(self, model, F):
+        # Longest run measured with the same number of traits (90th
+        # percentile over all runs if there are none), else the default
+        records = self._records(model)
+        same = [r['ticks'] for r in records if r['F'] == F and r.get('ticks') is not None]
+        if same:
+            return max(same)
+        ticks = [r['ticks'] for r in records if r.get('ticks') is not None]
+        return int(np.percentile(ticks, 90)) if ticks else DEFAULT_TICKS[model]
+
+    def correction(self, model):
+        # 90th percentile of measured / estimated footprint, at least 1
+        ratios = [r['measured_mb'] / r['static_mb'] for r in self._records(model)
+                  if r.get('measured_mb') and r.get('static_mb')]
+        return max(1.0, float(np.percentile(ratios, 90))) if ratios else 1.0
+
+    def estimate_mb(self, model, parameters):
+        size = features(model, parameters)
+        ticks = size['ticks'] or self.expected_ticks(model, size['F'])
+        return static_run_mb(model, size['agents'], size['F'], ticks) * self.correction(model)
+
+    def heap_mb(self, model, parameters):
+        # -Xmx with 50% headroom over the estimated heap, and never below the
+        # largest heap an earlier run of about the same size got (see
+        # netlogo_pool: one JVM per process, so its heap can't grow later)
+        size = features(model, parameters)
+        ticks = size['ticks'] or self.expected_ticks(model, size['F'])
+        heap = 1.5 * static_heap_mb(model, size['agents'], size['F'], ticks) * self.correction(model)
+        similar = [r['heap_mb'] for r in self._records(model)
+                   if r.get('heap_mb') and r['F'] == size['F']
+                   and size['agents'] / HEAP_SIMILAR <= r['agents'] <= size['agents'] * HEAP_SIMILAR]
+        heap = max([heap, HEAP_MIN_MB] + similar)
+        return int(np.ceil(heap / HEAP_STEP_MB) * HEAP_STEP_MB)
+
+    def record(self, model, parameters, ticks, heap_mb, measured_mb):
+        size = features(model, parameters)
+        record = {'model': model, 'agents': size['agents'], 'F': size['F'], 'ticks': ticks, 'heap_mb': heap_mb,
+                  'static_mb': static_run_mb(model, size['agents'], size['F'], ticks or DEFAULT_TICKS[model]),
+                  'measured_mb': measured_mb}
+        self.records.append(record)
+        if len(self._records(model)) > 2 * HISTORY_RUNS:
+            self.records = recent(self.records)
+        if self.path is not None:
+            # One short line per write, so appends of concurrent workers don't mix
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+
+class Run:
+    # What the models need to know about an admitted run
+    def __init__(self, estimate_mb, heap_mb):
+        self.estimate_mb = estimate_mb
+        self.heap_mb = heap_mb
+        self.jvmargs = [f'-Xmx{heap_mb}m']
+        self.ticks = None
+
+class MemoryScheduler:
+    def __init__(self, budget_mb=None, ledger=MEMORY_LEDGER, history=MEMORY_HISTORY, poll=0.5):
+        self.budget_mb = default_budget_mb() if budget_mb is None else budget_mb
+        self.ledger = ledger
+        self.model = MemoryModel(history)
+        self.poll = poll
+
+    @contextmanager
+    def _ledger(self):
+        # Read-modify-write of the reservations under an exclusive lock;
+        # entries of processes that are gone are dropped
+        with open(self.ledger + '.lock', 'a') as lock:
+            _lock(lock)
+            try:
+                try:
+                    with open(self.ledger) as f:
+                        entries = json.load(f)
+                except (OSError, json.JSONDecodeError):
+                    entries = {}
+                entries = {pid: entry for pid, entry in entries.items() if _alive(int(pid))}
+                yield entries
+                tmp = f'{self.ledger}.{os.getpid()}.tmp'
+                with open(tmp, 'w') as f:
+                    json.dump(entries, f)
+                os.replace(tmp, self.ledger)
+            finally:
+                _unlock(lock)
+
+    def _reserve(self, mb):
+        # True once reserved. Runs go ahead when they fit in the budget, or
+        # when no other worker is running (so a run bigger than the whole
+        # budget still gets its turn, alone)
+        pid = str(os.getpid())
+        with self._ledger() as entries:
+            others = {p: e for p, e in entries.items() if p != pid}
+            used = sum(e['mb'] for e in others.values())
+            if used + mb <= self.budget_mb or not any(e['running'] for e in others.values()):
+                entries[pid] = {'mb': mb, 'running': True}
+                return True
+        return False
+
+    def _release(self, mb):
+        with self._ledger() as entries:
+            entries[str(os.getpid())] = {'mb': mb, 'running': False}
+
+    @contextmanager
+    def admit(self, model, parameters):
+        estimate = self.model.estimate_mb(model, parameters)
+        run = Run(estimate, self.model.heap_mb(model, parameters))
+        while not self._reserve(estimate):
+            time.sleep(self.poll)
+        succeeded = False
+        try:
+            yield run
+            succeeded = True
+        finally:
+            # The JVM and its heap stay, so the process keeps what it holds now
+            measured = rss_mb()
+            self._release(measured or 0)
+            if succeeded:
+                self.model.record(model, parameters, run.ticks, run.heap_mb, measured)
+
+    def max_workers(self, model, param_distributions):
+        # Workers that fit in the budget with the largest runs of the space
+        largest = {name: max(values) if all(isinstance(v, (int, float, np.number)) for v in values) else values[0]
+                   for name, values in param_distributions.items()}
+        return max(1, min(os.cpu_count() or 1, int(self.budget_mb // self.model.estimate_mb(model, largest))))
+
+def _lock(f):
+    # Exclusive lock of an open file, waiting for other processes
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return
+    f.seek(0)
+    while True:
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            return
+        except OSError:
+            time.sleep(0.05)
+
+def _unlock(f):
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def _alive(pid):
+    if os.name == 'nt':
+        # os.kill(pid, 0) would terminate the process there
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return kernel32.GetLastError() == 5  # access denied: it exists
+        code = ctypes.c_ulong()
+        kernel32.GetExitCodeProcess(handle, ctypes.byref(code))
+        kernel32.CloseHandle(handle)
+        return code.value == 259  # STILL_ACTIVE
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+# One scheduler per process
+_scheduler = None
+_scheduler_pid = None
+
+def get_scheduler():
+    global _scheduler, _scheduler_pid
+    if _scheduler is None or _scheduler_pid != os.getpid():
+        _scheduler = MemoryScheduler()
+        _scheduler_pid = os.getpid()
+    return _scheduler
+
+def admit(model, parameters):
+    return get_scheduler().admit(model, parameters)
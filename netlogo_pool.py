@@ -0,0 +1,154 @@
+import os
+import warnings
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import pynetlogo
+
+from instrument import phase
+
+# Pool of long-lived NetLogo workspaces. Starting a NetLogoLink and parsing the
+# .nlogo file costs far more than a short run, so every worker process keeps
+# its workspaces loaded and only calls 'setup' between runs (done by the
+# run_model_with_parameters functions themselves, setup starts with clear-all).
+# Workspaces are recycled after MAX_RUNS runs or once the process grows past
+# MAX_RSS_MB, which keeps memory leaked by the JVM in check. The JVM heap
+# doesn't shrink, so when a recycle leaves the process above MAX_RSS_MB the
+# size check pauses for MAX_RUNS runs instead of reloading after every run.
+#
+# JPype starts one JVM per process, so the jvmargs (e.g. -Xmx) of the first
+# workspace hold for all later ones; workspaces are pooled per model file.
+
+MAX_RUNS = int(os.environ.get('NETLOGO_POOL_MAX_RUNS', 100))
+MAX_RSS_MB = float(os.environ.get('NETLOGO_POOL_MAX_RSS_MB', 4096))
+
+def current_rss_mb():
+    # Resident set size of this process (the JVM lives in it as well)
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError):
+        # No /proc (e.g. macOS): fall back to the peak, ru_maxrss is in bytes
+        # there; unknown on Windows, where workspaces are only recycled by runs
+        if resource is None:
+            return 0.0
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 20
+
+# jvmargs the JVM of this process was started with
+_jvmargs = None
+_jvmargs_pid = None
+
+def heap_mb(jvmargs):
+    # -Xmx of jvmargs in MB, None if not set
+    units = {'k': 2 ** -10, 'm': 1, 'g': 2 ** 10, 't': 2 ** 20}
+    for arg in jvmargs:
+        if arg.startswith('-Xmx'):
+            value = arg[4:].lower()
+            if value[-1] in units:
+                return float(value[:-1]) * units[value[-1]]
+            return float(value) / 2 ** 20
+    return None
+
+def check_jvmargs(jvmargs):
+    # Remember the arguments of the first JVM start and warn when a later
+    # workspace asks for a larger heap than that JVM has
+    global _jvmargs, _jvmargs_pid
+    if _jvmargs is None or _jvmargs_pid != os.getpid():
+        _jvmargs, _jvmargs_pid = list(jvmargs), os.getpid()
+        return
+    wanted, started = heap_mb(jvmargs), heap_mb(_jvmargs)
+    if wanted is not None and started is not None and wanted > started:
+        warnings.warn(f"The JVM of this process runs with -Xmx{started:g}m, less than the {wanted:g}m asked for")
+
+class NetLogoUnavailable(RuntimeError):
+    # NetLogo (JVM or NetLogoLink) could not be started in this process
+    pass
+
+class Workspace:
+    def __init__(self, model_file, jvmargs):
+        with phase('jvm_start'):
+            try:
+                self.link = pynetlogo.NetLogoLink(gui=False, jvmargs=list(jvmargs))
+            except Exception as e:
+                raise NetLogoUnavailable(f"NetLogo could not be started: {e!r}") from e
+        with phase('load_model'):
+            self.link.load_model(model_file)
+        self.runs = 0
+
+    def healthy(self):
+        try:
+            return self.link.report('1 + 1') == 2
+        except Exception:
+            return False
+
+    def close(self):
+        try:
+            self.link.kill_workspace()
+        except Exception:
+            pass
+
+class WorkspacePool:
+    def __init__(self, max_runs=MAX_RUNS, max_rss_mb=MAX_RSS_MB):
+        self.max_runs = max_runs
+        self.max_rss_mb = max_rss_mb
+        self.idle = {}
+        self.created = 0
+        self.recycled = 0
+        self.rss_pause = 0  # runs left without the size check
+
+    @contextmanager
+    def lease(self, model_file, jvmargs=()):
+        key = os.path.abspath(model_file)
+        check_jvmargs(jvmargs)
+        workspace = self.idle.pop(key, None)
+        if workspace is not None and not workspace.healthy():
+            workspace.close()
+            workspace = None
+        if workspace is None:
+            workspace = Workspace(key, jvmargs)
+            self.created += 1
+
+        succeeded = False
+        try:
+            yield workspace.link
+            succeeded = True
+        finally:
+            workspace.runs += 1
+            if self.rss_pause:
+                self.rss_pause -= 1
+                too_big = False
+            else:
+                too_big = current_rss_mb() > self.max_rss_mb
+            # A failed run may leave the workspace in any state, so drop it
+            if not succeeded or workspace.runs >= self.max_runs or too_big:
+                workspace.close()
+                self.recycled += 1
+                if too_big and current_rss_mb() > self.max_rss_mb:
+                    # Closing it gave nothing back: only a new process would
+                    self.rss_pause = self.max_runs
+            else:
+                self.idle[key] = workspace
+
+    def close(self):
+        for workspace in self.idle.values():
+            workspace.close()
+        self.idle = {}
+
+# One pool per worker process (joblib/loky workers each get their own)
+_pool = None
+_pool_pid = None
+
+def get_pool():
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        _pool = WorkspacePool()
+        _pool_pid = os.getpid()
+    return _pool
+
+def lease(model_file, jvmargs=()):
+    return get_pool().lease(model_file, jvmargs)
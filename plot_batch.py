@@ -0,0 +1,128 @@
+import argparse
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.stats import rankdata
+from sklearn.base import clone
+
+from journal import get_journal, trial_key
+from sim_cache import NotRecorded, recorded_only
+
+# Renders the fits of the best candidates of a search to image files without
+# simulating anything again: every candidate's predictions are read back from
+# the simulation cache (MyModel(cache=True), the default, stores every seeded
+# run of the search there), and candidates whose runs are not cached (e.g.
+# searches without a seed) are skipped and reported. The figures are drawn
+# with the non-interactive Agg backend in a pool of processes, so this also
+# works on headless nodes.
+#
+#   python bc_main.py --plot-top 10 --plot-dir fits     (after the search)
+#   python plot_batch.py bc search.db --top 10 --format svg --engine numpy
+#                                                       (from a trial journal)
+
+def top_candidates(cv_results, k):
+    # (rank, params, mean CV error) of the k best distinct candidates. Of a
+    # successive halving search only the last rung counts: earlier rungs hold
+    # the same candidates at lower fidelity.
+    rows = np.arange(len(cv_results['params']))
+    ranks = np.asarray(cv_results['rank_test_score'])
+    if 'iter' in cv_results:
+        rows = rows[np.asarray(cv_results['iter']) == np.max(cv_results['iter'])]
+        # Ranks within that rung, failed candidates last as in build_cv_results
+        scores = np.asarray(cv_results['mean_test_score'])[rows]
+        ranks = np.zeros(len(ranks), dtype=int)
+        ranks[rows] = rankdata(-np.where(np.isnan(scores), -np.inf, scores), method='min')
+    candidates, seen = [], set()
+    for i in rows[np.argsort(ranks[rows], kind='stable')]:
+        key = trial_key(cv_results['params'][i])
+        if key in seen:
+            continue
+        seen.add(key)
+        candidates.append((int(ranks[i]), cv_results['params'][i], -float(cv_results['mean_test_score'][i])))
+        if len(candidates) == k:
+            break
+    return candidates
+
+def journal_results(path, search=None):
+    # Finished trials of a journal as the cv_results_ entries used above; by
+    # default those of the search with the most finished trials
+    journal = get_journal(path)
+    if search is None or len(search) < 64:
+        finished = [(count, s) for s, status, count, _ in journal.summary()
+                    if status == 'finished' and s.startswith(search or '')]
+        if not finished:
+            raise ValueError(f"no finished trials in {path}" + (f" for search {search}" if search else ""))
+        search = max(finished)[1]
+    results = [r for r in journal.finished(search) if not r['abandoned']]
+    mean_scores = np.array([np.mean(r['scores']) for r in results])
+    return {'params': [r['params'] for r in results],
+            'mean_test_score': mean_scores,
+            'rank_test_score': pd.Series(-mean_scores).rank(method='min').to_numpy(dtype=int)}
+
+def _agg_backend():
+    import matplotlib
+    matplotlib.use('Agg')
+
+def render(kind, model, params, X, y, filename, error=None):
+    # One figure from recorded predictions; False if a run isn't cached
+    model = clone(model).set_params(**params, cache=True)
+    model.fit(X)
+    try:
+        with recorded_only():
+            predictions = model.predict(X)
+    except NotRecorded:
+        return False
+    if kind == 'cd':
+        from cd_plot_fit import plot_fit
+        plot_fit(predictions, y, filename=filename)
+    else:
+        from bc_plot_fit import plot_fit
+        plot_fit(X, y, error=error, params=params, predictions=predictions, filename=filename)
+    return True
+
+def render_top(kind, model, cv_results, X, y, k=10, directory='fits', fmt='png', n_jobs=None):
+    # Figures of the k best candidates (kind 'bc' or 'cd'); returns
+    # (rank, filename or None if not cached) per candidate
+    os.makedirs(directory, exist_ok=True)
+    candidates = top_candidates(cv_results, k)
+    filenames = [os.path.join(directory, f'{kind}_{position:03d}_rank{rank}.{fmt}')
+                 for position, (rank, _, _) in enumerate(candidates, 1)]
+    # Fresh processes, so nothing of an interactive backend of this one is inherited
+    with ProcessPoolExecutor(max_workers=n_jobs, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_agg_backend) as pool:
+        futures = [pool.submit(render, kind, model, params, X, y, filename, error)
+                   for (_, params, error), filename in zip(candidates, filenames)]
+        rendered = [future.result() for future in futures]
+    return [(rank, filename if ok else None) for (rank, _, _), filename, ok in zip(candidates, filenames, rendered)]
+
+def report(rendered):
+    for rank, filename in rendered:
+        print(f"rank {rank:4d}: {filename or 'not in the simulation cache, skipped'}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Plot the best candidates of a journaled search")
+    parser.add_argument('model', choices=['bc', 'cd'])
+    parser.add_argument('journal', help="SQLite trial journal of the search (--journal of bc_main/cd_main)")
+    parser.add_argument('--search', help="search id (prefix); default: the one with most finished trials")
+    parser.add_argument('--top', type=int, default=10, help="number of candidates to plot")
+    parser.add_argument('--dir', default='fits', help="output directory")
+    parser.add_argument('--format', choices=['png', 'svg', 'pdf'], default='png')
+    parser.add_argument('--engine', default='netlogo', help="engine the search ran with")
+    parser.add_argument('--seed', type=int, default=0, help="seed the search ran with")
+    parser.add_argument('--replicates', type=int, default=1, help="replicates the search ran with")
+    parser.add_argument('--n-jobs', type=int, default=None, help="rendering processes")
+    args = parser.parse_args()
+
+    if args.model == 'cd':
+        from cd_optimise import MyModel
+    else:
+        from bc_optimise import MyModel
+    # Same target as the mains
+    y = pd.read_csv(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'random_data.csv')).iloc[:, -1]
+    X = np.ones((y.shape[0], 1))
+    model = MyModel(engine=args.engine, seed=args.seed, n_replicates=args.replicates)
+    report(render_top(args.model, model, journal_results(args.journal, args.search), X, y,
+                      k=args.top, directory=args.dir, fmt=args.format, n_jobs=args.n_jobs))
@@ -0,0 +1,615 @@
+import inspect
+import numbers
+import time
+import warnings
+
+import numpy as np
+from joblib import Parallel, delayed, effective_n_jobs
+from scipy.stats import norm, rankdata
+from sklearn.base import clone
+from sklearn.ensemble import ExtraTreesRegressor
+from sklearn.model_selection import ParameterSampler, check_cv
+from sklearn.utils import check_random_state
+
+from instrument import evaluation, note
+from journal import get_journal, search_id, trial_key
+from work_queue import TaskFailed
+
+# The models ignore X: a candidate's simulation is the same for every CV fold
+# and the folds only pick different slices of the target. The search below
+# therefore simulates each candidate once and scores all folds from that one
+# output, while reporting results in the same cv_results_ layout as
+# RandomizedSearchCV.
+
+class SimulationAbandoned(Exception):
+    # Raised by an estimator's predict when it cut a run short because the
+    # run could no longer beat abandon_above; bounds holds lower bounds of
+    # the errors on the CV folds
+    def __init__(self, bounds):
+        super().__init__(f"run abandoned, error bounds {bounds}")
+        self.bounds = np.asarray(bounds, dtype=float)
+
+def replicate_seeds(seed, n_replicates):
+    # Seeds of the replicate runs of a candidate. Without a seed every
+    # replicate is unseeded (and never cached), however many there are. A
+    # single replicate keeps the plain seed; several get seeds derived from
+    # seed only, so all candidates of a search share the same random numbers
+    # (common random numbers), which keeps seed noise out of the differences
+    # between their scores.
+    if seed is None:
+        return [None] * n_replicates
+    if n_replicates == 1:
+        return [seed]
+    state = np.random.SeedSequence(seed).generate_state(n_replicates)
+    return [int(s) % 2 ** 31 for s in state]  # NetLogo's random-seed takes 32 bit signed ints
+
+def take(y, indices):
+    # Index pandas objects by position and arrays directly
+    return y.iloc[indices] if hasattr(y, 'iloc') else y[indices]
+
+def evaluate_candidate(estimator, params, X, y, folds, error_score=np.nan, abandon_above=None):
+    # One instrumentation record per candidate (when INSTRUMENT_DIR is set)
+    with evaluation(params):
+        result = _evaluate_candidate(estimator, params, X, y, folds, error_score, abandon_above)
+        note(mean_score=np.mean(result['scores']), abandoned=result['abandoned'])
+    return result
+
+def _evaluate_candidate(estimator, params, X, y, folds, error_score=np.nan, abandon_above=None):
+    # Simulate once (fit + predict on the whole X), then score every fold.
+    # MyModel.score reuses the stored predictions_, so no fold re-simulates.
+    # With abandon_above (a mean fold error) estimators that can stream their
+    # runs get the fold targets and may stop runs that can't get below it.
+    model = clone(estimator).set_params(**params)
+    fill = np.nan if error_score == 'raise' else error_score
+    result = {'params': params, 'scores': np.full(len(folds), fill, dtype=float),
+              'fit_time': 0.0, 'score_times': np.zeros(len(folds)), 'cpu_time': 0.0,
+              'abandoned': False, 'replicate_scores': None}
+
+    fit_params = {}
+    if abandon_above is not None and 'abandon_above' in inspect.signature(model.fit).parameters:
+        fit_params = {'targets': [take(y, test) for test in folds], 'abandon_above': abandon_above}
+
+    start = time.time()
+    cpu_start = time.process_time()
+    try:
+        model.fit(X, y, **fit_params)
+        model.predict(X)
+    except SimulationAbandoned as e:
+        # Score with the bounds: already worse than the best candidate
+        result['scores'] = -e.bounds
+        result['abandoned'] = True
+        result['fit_time'] = time.time() - start
+        result['cpu_time'] = time.process_time() - cpu_start
+        return result
+    except Exception as e:
+        if error_score == 'raise':
+            raise
+        warnings.warn(f"Simulation failed for {params}: {e!r}")
+        result['fit_time'] = time.time() - start
+        result['cpu_time'] = time.process_time() - cpu_start
+        return result
+    result['fit_time'] = time.time() - start
+
+    # Estimators with replicate runs report every replicate's score
+    replicates = hasattr(model, 'score_replicates')
+    for k, test in enumerate(folds):
+        start = time.time()
+        try:
+            if replicates:
+                scores = model.score_replicates(take(X, test), take(y, test))
+                if result['replicate_scores'] is None:
+                    result['replicate_scores'] = np.full((len(folds), len(scores)), np.nan)
+                result['replicate_scores'][k] = scores
+                result['scores'][k] = np.mean(scores)
+            else:
+                result['scores'][k] = model.score(take(X, test), take(y, test))
+        except Exception as e:
+            if error_score == 'raise':
+                raise
+            warnings.warn(f"Scoring failed for {params}: {e!r}")
+        result['score_times'][k] = time.time() - start
+
+    result['cpu_time'] = time.process_time() - cpu_start
+    return result
+
+def evaluate_journaled(journal_path, search, key, estimator, params, X, y, folds,
+                       error_score=np.nan, abandon_above=None):
+    # evaluate_candidate, with the trial written to the journal when it
+    # starts and when it completes (or fails)
+    journal = get_journal(journal_path)
+    journal.start(search, key, params, estimator.get_params(deep=False).get('seed'))
+    try:
+        result = evaluate_candidate(estimator, params, X, y, folds, error_score, abandon_above)
+    except BaseException as e:
+        journal.record(search, key, failed_result(len(folds)), error=repr(e))
+        raise
+    journal.record(search, key, result)
+    return result
+
+def failed_result(n_folds):
+    # Journal entry of a candidate whose evaluation raised
+    return {'scores': np.full(n_folds, np.nan), 'fit_time': 0.0, 'score_times': np.zeros(n_folds),
+            'cpu_time': 0.0, 'abandoned': False}
+
+def build_cv_results(results, n_splits):
+    # Same keys as RandomizedSearchCV.cv_results_
+    n_candidates = len(results)
+    scores = np.array([r['scores'] for r in results], dtype=float).reshape(n_candidates, n_splits)
+    fit_times = np.array([r['fit_time'] for r in results])
+    score_times = np.array([r['score_times'] for r in results], dtype=float).reshape(n_candidates, n_splits)
+    params = [r['params'] for r in results]
+
+    cv_results = {
+        'mean_fit_time': fit_times,
+        'std_fit_time': np.zeros(n_candidates),  # one simulation shared by all folds
+        'mean_score_time': score_times.mean(axis=1),
+        'std_score_time': score_times.std(axis=1)
+    }
+
+    names = sorted({name for p in params for name in p})
+    for name in names:
+        column = np.ma.MaskedArray(np.empty(n_candidates, dtype=object), mask=True)
+        for i, p in enumerate(params):
+            if name in p:
+                column[i] = p[name]
+        cv_results[f'param_{name}'] = column
+    cv_results['params'] = params
+
+    for k in range(n_splits):
+        cv_results[f'split{k}_test_score'] = scores[:, k]
+    mean_scores = scores.mean(axis=1)
+    cv_results['mean_test_score'] = mean_scores
+    cv_results['std_test_score'] = scores.std(axis=1)
+
+    # Replicate runs: mean score of every replicate over the folds and the
+    # standard error of the candidate's mean score
+    n_replicates = max((r['replicate_scores'].shape[1] for r in results if r['replicate_scores'] is not None), default=1)
+    if n_replicates > 1:
+        replicate_scores = np.full((n_candidates, n_replicates), np.nan)
+        for i, r in enumerate(results):
+            if r['replicate_scores'] is not None:
+                replicate_scores[i] = r['replicate_scores'].mean(axis=0)
+        for k in range(n_replicates):
+            cv_results[f'replicate{k}_test_score'] = replicate_scores[:, k]
+        cv_results['sem_test_score'] = replicate_scores.std(axis=1, ddof=1) / np.sqrt(n_replicates)
+
+    # Best (highest) score gets rank 1, failed candidates come last
+    ranked = np.where(np.isnan(mean_scores), -np.inf, mean_scores)
+    cv_results['rank_test_score'] = rankdata(-ranked, method='min').astype(np.int32)
+
+    return cv_results
+
+def throughput(results, n_candidates, wall_time):
+    # Candidates judged per CPU-hour of simulation and scoring (CPU time is
+    # measured inside the workers, so it is comparable across n_jobs)
+    cpu_hours = sum(r['cpu_time'] for r in results) / 3600
+    return {
+        'candidates': n_candidates,
+        'simulations': len(results),
+        'cpu_hours': cpu_hours,
+        'wall_seconds': wall_time,
+        'candidates_per_cpu_hour': n_candidates / cpu_hours if cpu_hours > 0 else np.inf
+    }
+
+class FoldSharedSearchCV:
+    def __init__(self, estimator, param_distributions, n_iter=10, cv=None, n_jobs=None,
+                 verbose=0, random_state=None, refit=True, error_score=np.nan, early_abandon=False,
+                 journal=None, executor=None):
+        self.estimator = estimator
+        self.param_distributions = param_distributions
+        self.n_iter = n_iter
+        self.cv = cv
+        self.n_jobs = n_jobs
+        self.verbose = verbose
+        self.random_state = random_state
+        self.refit = refit
+        self.error_score = error_score
+        self.early_abandon = early_abandon
+        self.journal = journal
+        self.executor = executor
+
+    def _folds(self, X, y):
+        cv = check_cv(self.cv)
+        return [np.asarray(test) for _, test in cv.split(X, y)]
+
+    def _begin(self, X, y):
+        # Per fit state; returns the CV test folds
+        self._start_time = time.time()
+        self._best_error = np.inf
+        folds = self._folds(X, y)
+        self._search_id = None
+        if self.journal is not None:
+            self._search_id = search_id(self.estimator, self.param_distributions, y, folds)
+        if self.executor is not None and hasattr(self.executor, 'wait_for_workers'):
+            # Batches are sized by the connected workers, so have some first
+            if self.verbose:
+                print("Waiting for workers to connect")
+            if not self.executor.wait_for_workers(timeout=self.executor.worker_timeout):
+                raise TaskFailed(f"no workers connected for {self.executor.worker_timeout:g} s")
+        return folds
+
+    def _previous(self):
+        # Finished trials of an earlier run of this search (with a journal)
+        if self.journal is None:
+            return []
+        results = get_journal(self.journal).finished(self._search_id)
+        self._update_best(results)
+        return results
+
+    def _update_best(self, results):
+        for result in results:
+            if not result['abandoned'] and np.isfinite(np.mean(result['scores'])):
+                self._best_error = min(self._best_error, -np.mean(result['scores']))
+
+    def _n_workers(self):
+        # Read again for every batch: executor workers come and go
+        if self.executor is not None:
+            return max(1, self.executor.n_workers)
+        return effective_n_jobs(self.n_jobs)
+
+    def _map(self, func, argument_lists):
+        # func(*arguments) for every entry on the joblib workers, or on the
+        # executor (e.g. a work_queue.WorkQueue) if there is one
+        if self.executor is not None:
+            return self.executor.map(func, argument_lists)
+        return Parallel(n_jobs=self.n_jobs, verbose=self.verbose)(
+            delayed(func)(*arguments) for arguments in argument_lists)
+
+    def _map_journaled(self, journal, keys, argument_lists):
+        # Executor workers may run on hosts without the journal file, so the
+        # trials are recorded here as their results come in
+        seed = self.estimator.get_params(deep=False).get('seed')
+        for key, arguments in zip(keys, argument_lists):
+            journal.start(self._search_id, key, arguments[1], seed)
+        tasks = [self.executor.submit(evaluate_candidate, *arguments) for arguments in argument_lists]
+        results = []
+        for key, arguments, task in zip(keys, argument_lists, tasks):
+            try:
+                result = self.executor.result(task)
+            except Exception as e:
+                journal.record(self._search_id, key, failed_result(len(arguments[4])), error=repr(e))
+                raise
+            journal.record(self._search_id, key, result)
+            results.append(result)
+        return results
+
+    def _run_batch(self, candidates, X, y, folds, abandon_above=None):
+        # Evaluate candidates in parallel. With a journal, finished trials are
+        # read back instead of simulated and new ones recorded as they finish.
+        argument_lists = [(self.estimator, params, X, y, folds, self.error_score, abandon_above)
+                          for params in candidates]
+        if self.journal is None:
+            return self._map(evaluate_candidate, argument_lists)
+
+        journal = get_journal(self.journal)
+        keys = [trial_key(params) for params in candidates]
+        results = [journal.get(self._search_id, key) for key in keys]
+        todo = [i for i, result in enumerate(results) if result is None]
+        if self.executor is None:
+            fresh = self._map(evaluate_journaled, [(self.journal, self._search_id, keys[i]) + argument_lists[i]
+                                                   for i in todo])
+        else:
+            fresh = self._map_journaled(journal, [keys[i] for i in todo], [argument_lists[i] for i in todo])
+        for i, result in zip(todo, fresh):
+            results[i] = result
+        for params, result in zip(candidates, results):
+            result['params'] = params
+        return results
+
+    def _candidates(self):
+        return list(ParameterSampler(self.param_distributions, self.n_iter, random_state=self.random_state))
+
+    def _evaluate(self, candidates, X, y, folds):
+        if not self.early_abandon:
+            results = self._run_batch(candidates, X, y, folds)
+            self._update_best(results)
+            return results
+
+        # One candidate per worker at a time, each allowed to run only while
+        # it can still beat the best mean error of the finished candidates
+        results = []
+        i = 0
+        while i < len(candidates):
+            chunk = self._n_workers()
+            batch = self._run_batch(candidates[i:i + chunk], X, y, folds,
+                                    self._best_error if np.isfinite(self._best_error) else None)
+            self._update_best(batch)
+            results += batch
+            i += chunk
+        return results
+
+    def _best_index(self):
+        return int(np.argmin(self.cv_results_['rank_test_score']))
+
+    def _finish(self, results, X, y, n_splits, **columns):
+        # columns: extra per-candidate cv_results_ entries
+        self.cv_results_ = build_cv_results(results, n_splits)
+        if self.early_abandon:
+            self.cv_results_['abandoned'] = np.array([r['abandoned'] for r in results])
+        self.cv_results_.update(columns)
+        self.n_splits_ = n_splits
+        self.throughput_ = throughput(results, self.n_candidates_, time.time() - self._start_time)
+        self.best_index_ = self._best_index()
+        self.best_params_ = self.cv_results_['params'][self.best_index_]
+        self.best_score_ = self.cv_results_['mean_test_score'][self.best_index_]
+
+        if self.refit:
+            # With a seeded model the simulation cache re-uses the best
+            # candidate's run (unseeded runs are never cached)
+            self.best_estimator_ = clone(self.estimator).set_params(**self.best_params_).fit(X, y)
+        return self
+
+    def fit(self, X, y):
+        folds = self._begin(X, y)
+
+        # A resumed search keeps its finished trials, retries the failed and
+        # interrupted ones and samples the rest of the n_iter candidates (the
+        # same ones again with a fixed random_state)
+        previous = self._previous()
+        done = {trial_key(result['params']) for result in previous}
+        running = set()
+        candidates = []
+        if self.journal is not None:
+            # Trials another live process is running are left to it and
+            # count against n_iter
+            running = get_journal(self.journal).in_progress(self._search_id)
+            candidates = get_journal(self.journal).unfinished(self._search_id)
+        candidates += [params for params in self._candidates() if trial_key(params) not in done | running]
+        unique = {trial_key(params): params for params in reversed(candidates)}
+        candidates = [params for params in candidates if unique.get(trial_key(params)) is params]
+        candidates = candidates[:max(0, self.n_iter - len(previous) - len(running))]
+
+        self.n_candidates_ = len(previous) + len(candidates)
+        results = previous + self._evaluate(candidates, X, y, folds)
+        return self._finish(results, X, y, len(folds))
+
+    def predict(self, X):
+        return self.best_estimator_.predict(X)
+
+    def score(self, X, y):
+        return self.best_estimator_.score(X, y)
+
+# Sequential model-based search over the same list-valued spaces. A forest of
+# extremely randomised trees is fitted to the mean CV score of every finished
+# candidate; the spread of its trees' predictions serves as uncertainty for
+# expected improvement. Each round proposes batch_size candidates at once (one
+# per parallel worker) using the "constant liar": after a candidate is picked
+# it is told to the surrogate with the worst score seen so far, so the rest of
+# the batch looks elsewhere.
+
+def is_numeric(values):
+    return all(isinstance(v, numbers.Number) and not isinstance(v, (bool, np.bool_)) for v in values)
+
+class SpaceEncoder:
+    # Candidates are index vectors into the value lists of param_distributions.
+    # Numeric parameters become one feature scaled to [0, 1], all others
+    # (strings, booleans) are one-hot encoded.
+    def __init__(self, param_distributions):
+        self.names = sorted(param_distributions)
+        self.values = []
+        for name in self.names:
+            values = param_distributions[name]
+            if not isinstance(values, (list, tuple, np.ndarray)):
+                raise ValueError(f"SurrogateSearchCV needs a list of values for {name!r}")
+            self.values.append(list(values))
+        self.numeric = [is_numeric(values) for values in self.values]
+        self.sizes = np.array([len(values) for values in self.values])
+
+    def params(self, point):
+        return {name: values[i] for name, values, i in zip(self.names, self.values, point)}
+
+    def point(self, params):
+        # Inverse of params(); None if a value is not in the space
+        point = []
+        for name, values in zip(self.names, self.values):
+            matches = [i for i, value in enumerate(values) if value == params.get(name)]
+            if not matches:
+                return None
+            point.append(matches[0])
+        return np.array(point)
+
+    def encode(self, points):
+        points = np.asarray(points)
+        columns = []
+        for k, (values, numeric) in enumerate(zip(self.values, self.numeric)):
+            if numeric:
+                numeric_values = np.asarray(values, dtype=float)
+                span = numeric_values.max() - numeric_values.min()
+                scaled = (numeric_values - numeric_values.min()) / span if span > 0 else np.zeros(len(values))
+                columns.append(scaled[points[:, k]][:, None])
+            else:
+                columns.append(np.eye(len(values))[points[:, k]])
+        return np.hstack(columns)
+
+    def sample(self, n, rng):
+        return rng.randint(0, self.sizes, size=(n, len(self.sizes)))
+
+    def neighbours(self, points, rng):
+        # Change one parameter of every point: numeric ones step to an adjacent
+        # value, categorical ones jump to any value
+        points = np.array(points)
+        k = rng.randint(0, len(self.sizes), size=len(points))
+        for row, column in enumerate(k):
+            if self.numeric[column]:
+                step = rng.choice([-1, 1])
+                points[row, column] = np.clip(points[row, column] + step, 0, self.sizes[column] - 1)
+            else:
+                points[row, column] = rng.randint(self.sizes[column])
+        return points
+
+def expected_improvement(mean, std, best, xi=0.01):
+    # Expected improvement over best for maximisation
+    std = np.maximum(std, 1e-12)
+    z = (mean - best - xi) / std
+    return (mean - best - xi) * norm.cdf(z) + std * norm.pdf(z)
+
+class SurrogateSearchCV(FoldSharedSearchCV):
+    def __init__(self, estimator, param_distributions, n_iter=10, cv=None, n_jobs=None,
+                 verbose=0, random_state=None, refit=True, error_score=np.nan, early_abandon=False,
+                 journal=None, executor=None, batch_size=None, n_initial=None, n_candidates=2000, xi=0.01):
+        super().__init__(estimator, param_distributions, n_iter=n_iter, cv=cv, n_jobs=n_jobs,
+                         verbose=verbose, random_state=random_state, refit=refit, error_score=error_score,
+                         early_abandon=early_abandon, journal=journal, executor=executor)
+        self.batch_size = batch_size
+        self.n_initial = n_initial
+        self.n_candidates = n_candidates
+        self.xi = xi
+
+    def _surrogate(self, encoder, points, scores, rng):
+        forest = ExtraTreesRegressor(n_estimators=100, min_samples_leaf=2, random_state=rng.randint(2 ** 31))
+        return forest.fit(encoder.encode(points), scores)
+
+    def _ask(self, encoder, points, scores, seen, n, rng):
+        # Propose n new points: maximise expected improvement over random and
+        # locally perturbed points, lying after every pick
+        points, scores = list(points), list(scores)
+        lie = min(scores)
+        top = [points[i] for i in np.argsort(scores)[::-1][:10]]
+        pool = np.vstack([encoder.sample(self.n_candidates, rng),
+                          encoder.neighbours(np.repeat(top, self.n_candidates // (2 * len(top)) + 1, axis=0), rng)])
+        pool = np.unique(pool, axis=0)
+        pool = pool[[tuple(p) not in seen for p in pool]]
+        features = encoder.encode(pool) if len(pool) else None
+
+        batch = []
+        while len(batch) < n and len(pool):
+            forest = self._surrogate(encoder, points, scores, rng)
+            per_tree = np.array([tree.predict(features) for tree in forest.estimators_])
+            ei = expected_improvement(per_tree.mean(axis=0), per_tree.std(axis=0), max(scores), self.xi)
+            pick = int(np.argmax(ei))
+            batch.append(pool[pick])
+            points.append(pool[pick])
+            scores.append(lie)
+            pool = np.delete(pool, pick, axis=0)
+            features = np.delete(features, pick, axis=0)
+        return batch
+
+    def fit(self, X, y):
+        folds = self._begin(X, y)
+        rng = check_random_state(self.random_state)
+        encoder = SpaceEncoder(self.param_distributions)
+        n_total = min(self.n_iter, int(np.prod(encoder.sizes.astype(float))))
+        batch_size = self.batch_size or self._n_workers()
+        n_initial = min(self.n_initial or max(batch_size, 2 * len(encoder.names)), n_total)
+
+        # A resumed search starts from the trials finished before and fills up
+        # the initial design (failed and interrupted ones may be proposed again)
+        results, points, scores = [], [], []
+        seen = set()
+        for result in self._previous():
+            point = encoder.point(result['params'])
+            if point is None or tuple(point) in seen:
+                continue
+            seen.add(tuple(point))
+            results.append(result)
+            score = np.mean(result['scores'])
+            if np.isfinite(score):
+                points.append(point)
+                scores.append(score)
+        candidates = []
+        if self.journal is not None:
+            for params in get_journal(self.journal).unfinished(self._search_id):
+                point = encoder.point(params)
+                if point is not None and tuple(point) not in seen:
+                    seen.add(tuple(point))
+                    candidates.append(point)
+        candidates = candidates[:n_total - len(results)]
+        n_initial = min(max(len(candidates), n_initial - len(results)), n_total - len(results))
+        if not candidates and n_initial == 0 and len(results) < n_total:
+            if len(scores) >= 2:
+                candidates = self._ask(encoder, points, scores, seen, min(batch_size, n_total - len(results)), rng)
+                seen.update(tuple(p) for p in candidates)
+            else:
+                n_initial = min(batch_size, n_total - len(results))
+
+        # Random initial design without repeats
+        while len(candidates) < n_initial:
+            point = encoder.sample(1, rng)[0]
+            if tuple(point) not in seen:
+                seen.add(tuple(point))
+                candidates.append(point)
+
+        while candidates:
+            batch = self._evaluate([encoder.params(p) for p in candidates], X, y, folds)
+            for point, result in zip(candidates, batch):
+                results.append(result)
+                score = np.mean(result['scores'])
+                if np.isfinite(score):
+                    points.append(point)
+                    scores.append(score)
+            if self.verbose and scores:
+                print(f"SurrogateSearchCV: {len(results)}/{n_total} candidates, best score {max(scores):.6g}")
+
+            n = min(self.batch_size or self._n_workers(), n_total - len(results))
+            if n <= 0:
+                break
+            if len(scores) < 2:
+                # Nothing to learn from yet (failed runs): keep sampling at random
+                candidates = [p for p in np.unique(encoder.sample(10 * n, rng), axis=0) if tuple(p) not in seen][:n]
+            else:
+                candidates = self._ask(encoder, points, scores, seen, n, rng)
+            seen.update(tuple(p) for p in candidates)
+
+        self.n_candidates_ = len(results)
+        return self._finish(results, X, y, len(folds))
+
+# Successive halving: all candidates are first simulated at a low fidelity
+# (fewer agents, a smaller world, ...), and only the best 1 / factor of every
+# rung is promoted to the next, factor times more expensive one, up to full
+# fidelity. fidelity(params, resource) returns the parameters to simulate at
+# resource in (0, 1]; every model module defines one for its own parameters.
+# The best candidate is chosen among the full fidelity runs only.
+
+class SuccessiveHalvingSearchCV(FoldSharedSearchCV):
+    def __init__(self, estimator, param_distributions, fidelity, n_iter=27, cv=None, n_jobs=None,
+                 verbose=0, random_state=None, refit=True, error_score=np.nan, journal=None,
+                 executor=None, factor=3, min_resource=1 / 9):
+        super().__init__(estimator, param_distributions, n_iter=n_iter, cv=cv, n_jobs=n_jobs,
+                         verbose=verbose, random_state=random_state, refit=refit, error_score=error_score,
+                         journal=journal, executor=executor)
+        self.fidelity = fidelity
+        self.factor = factor
+        self.min_resource = min_resource
+
+    def resources(self):
+        # min_resource, min_resource * factor, ..., 1
+        n_rungs = int(np.ceil(np.log(1 / self.min_resource) / np.log(self.factor) - 1e-9)) + 1
+        return [min(1.0, self.min_resource * self.factor ** k) for k in range(n_rungs)]
+
+    def _evaluate_at(self, candidates, resource, X, y, folds):
+        results = self._evaluate([self.fidelity(params, resource) for params in candidates], X, y, folds)
+        for params, result in zip(candidates, results):
+            result['params'] = params
+        return results
+
+    def _best_index(self):
+        last = np.flatnonzero(self.cv_results_['iter'] == self.cv_results_['iter'].max())
+        scores = self.cv_results_['mean_test_score'][last]
+        if np.isnan(scores).all():
+            return int(last[0])
+        return int(last[np.nanargmax(scores)])
+
+    def fit(self, X, y):
+        # With a journal a rerun reads back every (candidate, resource) run
+        # that finished before, so it replays the same rungs up to the crash
+        folds = self._begin(X, y)
+        candidates = self._candidates()
+        self.n_candidates_ = len(candidates)
+
+        results, iters, resources = [], [], []
+        for k, resource in enumerate(self.resources()):
+            if k > 0:
+                # Promote the best 1 / factor of the previous rung
+                scores = np.array([np.mean(r['scores']) for r in rung])
+                scores = np.where(np.isnan(scores), -np.inf, scores)
+                keep = max(1, int(np.ceil(len(candidates) / self.factor)))
+                candidates = [candidates[i] for i in np.argsort(-scores, kind='stable')[:keep]]
+            rung = self._evaluate_at(candidates, resource, X, y, folds)
+            results += rung
+            iters += [k] * len(rung)
+            resources += [resource] * len(rung)
+            if self.verbose:
+                best = max(np.mean(r['scores']) for r in rung)
+                print(f"SuccessiveHalvingSearchCV: rung {k}, {len(rung)} candidates at resource {resource:.3g}, best score {best:.6g}")
+
+        return self._finish(results, X, y, len(folds), iter=np.array(iters), n_resources=np.array(resources))
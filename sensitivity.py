@@ -0,0 +1,211 @@
+import argparse
+import warnings
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from scipy.stats import qmc
+from sklearn.base import clone
+
+from search_cv import SpaceEncoder
+
+# Global sensitivity analysis of the fitting error over the parameter spaces
+# of bc_main.py / cd_main.py. Morris screening (elementary effects along
+# random one-at-a-time trajectories) ranks the parameters with few runs;
+# Sobol indices from Saltelli samples (first order S1 and total ST) split
+# the variance of the error between them. Every point is evaluated through
+# MyModel with n_replicates runs on common seeds (see replicate_seeds) and
+# its error is their mean; points that occur more than once (Morris
+# trajectories on the discrete grids often meet) are simulated once, and
+# the simulation cache serves repeats across runs. The indices come with
+# bootstrap confidence intervals, all resamples computed at once.
+#
+# The spaces are the value lists of param_grid: a unit coordinate picks a
+# value by position, so string and boolean parameters are treated as ordered
+# levels (their Morris effects are those of switching value).
+#
+#   python sensitivity.py bc morris --trajectories 20 --replicates 3
+#   python sensitivity.py cd sobol --samples 256 --engine python --output cd_sobol.csv
+
+def morris_sample(n_factors, n_trajectories, levels=4, seed=None):
+    # (trajectories x factors + 1 x factors) unit points on a grid of `levels`
+    # levels, each row differing from the previous one in one factor by delta;
+    # returns them with the factor changed at every step and its direction
+    rng = np.random.default_rng(seed)
+    delta = levels / (2 * (levels - 1))
+    r, k = n_trajectories, n_factors
+    # Random base points whose steps of +delta stay on the grid
+    base = rng.integers(0, levels // 2, size=(r, k)) / (levels - 1)
+    order = np.argsort(rng.random((r, k)), axis=1)
+    sign = rng.choice([-1, 1], size=(r, k))
+    # Factors that go down start delta higher
+    start = base + delta * (sign < 0)
+    steps = np.zeros((r, k + 1, k))
+    rows = np.arange(r)[:, None]
+    steps[rows, np.arange(1, k + 1)[None, :], order] = sign[rows, order] * delta
+    points = start[:, None, :] + np.cumsum(steps, axis=1)
+    return points, order, sign[rows, order]
+
+def saltelli_sample(n_factors, n_samples, seed=None):
+    # A, B and the k matrices A_B^i (A with column i from B), as
+    # (n_samples x k + 2 x k) unit points: row j holds A_j, B_j, A_B^1_j, ...
+    sobol = qmc.Sobol(2 * n_factors, scramble=True, seed=seed)
+    base = sobol.random(n_samples)
+    A, B = base[:, :n_factors], base[:, n_factors:]
+    AB = np.repeat(A[:, None, :], n_factors, axis=1)
+    i = np.arange(n_factors)
+    AB[:, i, i] = B
+    return np.concatenate([A[:, None], B[:, None], AB], axis=1)
+
+def unit_to_points(unit, sizes, method):
+    # Index vectors into the value lists. Morris levels include both ends of
+    # every list; Saltelli coordinates pick every value with equal chance.
+    if method == 'morris':
+        return np.rint(unit * (sizes - 1)).astype(int)
+    return np.minimum(np.floor(unit * sizes), sizes - 1).astype(int)
+
+def score_params(estimator, params, X, y):
+    # Error of every replicate run of one point (NaN if the run failed)
+    model = clone(estimator).set_params(**params)
+    try:
+        model.fit(X)
+        return -np.asarray(model.score_replicates(X, y), dtype=float)
+    except Exception as e:
+        warnings.warn(f"Simulation failed for {params}: {e!r}")
+        return np.full(getattr(model, 'n_replicates', 1), np.nan)
+
+def evaluate(estimator, encoder, points, X, y, n_jobs=None, executor=None, verbose=0):
+    # Mean replicate error of every point (any leading shape), each distinct
+    # point simulated once; executor: e.g. a work_queue.WorkQueue
+    flat = points.reshape(-1, points.shape[-1])
+    unique, inverse = np.unique(flat, axis=0, return_inverse=True)
+    arguments = [(estimator, encoder.params(point), X, y) for point in unique]
+    if executor is not None:
+        errors = executor.map(score_params, arguments)
+    else:
+        errors = Parallel(n_jobs=n_jobs, verbose=verbose)(delayed(score_params)(*a) for a in arguments)
+    means = np.array([np.nanmean(e) if np.isfinite(e).any() else np.nan for e in errors])
+    return means[inverse.ravel()].reshape(points.shape[:-1]), len(unique)
+
+def _bootstrap_indices(n, n_bootstrap, seed):
+    # Resamples as rows of indices, the first one being the sample itself
+    rng = np.random.default_rng(seed)
+    indices = rng.integers(0, n, size=(n_bootstrap + 1, n))
+    indices[0] = np.arange(n)
+    return indices
+
+def _interval(estimates, confidence):
+    # Estimate of the sample (row 0) and percentile interval of the resamples
+    tail = 100 * (1 - confidence) / 2
+    low, high = np.nanpercentile(estimates[1:], [tail, 100 - tail], axis=0)
+    return estimates[0], low, high
+
+def morris_indices(Y, order, sign, delta, names, n_bootstrap=1000, confidence=0.95, seed=None):
+    # mu, mu* (mean absolute elementary effect) and sigma of every factor
+    # from Y (trajectories x factors + 1), mu* with a bootstrap interval over
+    # the trajectories
+    r, k = order.shape
+    effects = np.empty((r, k))
+    rows = np.arange(r)[:, None]
+    effects[rows, order] = np.diff(Y, axis=1) / (sign * delta)
+    resampled = effects[_bootstrap_indices(r, n_bootstrap, seed)]
+    mu_star, low, high = _interval(np.nanmean(np.abs(resampled), axis=1), confidence)
+    return pd.DataFrame({
+        'mu': np.nanmean(effects, axis=0),
+        'mu_star': mu_star,
+        'mu_star_low': low,
+        'mu_star_high': high,
+        'sigma': np.nanstd(effects, axis=0, ddof=1)
+    }, index=pd.Index(names, name='parameter')).sort_values('mu_star', ascending=False)
+
+def sobol_indices(Y, names, n_bootstrap=1000, confidence=0.95, seed=None):
+    # First order (Saltelli 2010) and total (Jansen) indices from Y
+    # (samples x factors + 2, columns A, B, A_B^i), with bootstrap intervals
+    # over the samples
+    resampled = Y[_bootstrap_indices(len(Y), n_bootstrap, seed)]
+    fA, fB, fAB = resampled[:, :, :1], resampled[:, :, 1:2], resampled[:, :, 2:]
+    variance = np.nanvar(np.concatenate([fA, fB], axis=1), axis=1)
+    first = np.nanmean(fB * (fAB - fA), axis=1) / variance
+    total = 0.5 * np.nanmean((fA - fAB) ** 2, axis=1) / variance
+    S1, S1_low, S1_high = _interval(first, confidence)
+    ST, ST_low, ST_high = _interval(total, confidence)
+    return pd.DataFrame({'S1': S1, 'S1_low': S1_low, 'S1_high': S1_high,
+                         'ST': ST, 'ST_low': ST_low, 'ST_high': ST_high},
+                        index=pd.Index(names, name='parameter')).sort_values('ST', ascending=False)
+
+def analyse(estimator, param_distributions, X, y, method='morris', n=20, levels=4, n_bootstrap=1000,
+            confidence=0.95, seed=None, n_jobs=None, executor=None, verbose=0):
+    # Sensitivity indices of the error over param_distributions: n Morris
+    # trajectories or n Saltelli base samples
+    encoder = SpaceEncoder(param_distributions)
+    k = len(encoder.names)
+    if method == 'morris':
+        unit, order, sign = morris_sample(k, n, levels, seed)
+    elif method == 'sobol':
+        unit = saltelli_sample(k, n, seed)
+    else:
+        raise ValueError(f"unknown method {method!r} (morris or sobol)")
+    points = unit_to_points(unit, encoder.sizes, method)
+    Y, n_runs = evaluate(estimator, encoder, points, X, y, n_jobs, executor, verbose)
+    if verbose:
+        print(f"{n_runs} distinct points simulated for {Y.size} evaluations")
+    if method == 'morris':
+        # Effects per grid step in index units, i.e. of a change of delta
+        return morris_indices(Y, order, sign, levels / (2 * (levels - 1)), encoder.names,
+                              n_bootstrap, confidence, seed)
+    return sobol_indices(Y, encoder.names, n_bootstrap, confidence, seed)
+
+def unimportant(indices, threshold=0.05):
+    # Parameters whose index (mu* relative to the largest, or ST) stays below
+    # threshold over the whole interval: candidates to freeze in the searches
+    if 'ST' in indices:
+        return list(indices.index[indices['ST_high'] < threshold])
+    return list(indices.index[indices['mu_star_high'] < threshold * indices['mu_star'].max()])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Morris / Sobol sensitivity of the fitting error")
+    parser.add_argument('model', choices=['bc', 'cd'])
+    parser.add_argument('method', choices=['morris', 'sobol'])
+    parser.add_argument('--trajectories', '--samples', dest='n', type=int, default=20,
+                        help="Morris trajectories or Saltelli base samples")
+    parser.add_argument('--levels', type=int, default=4, help="Morris grid levels (even)")
+    parser.add_argument('--replicates', type=int, default=1, help="runs per point with common seeds")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--engine', default='netlogo', help="netlogo, or numpy (bc) / python (cd)")
+    parser.add_argument('--bootstrap', type=int, default=1000, help="bootstrap resamples of the intervals")
+    parser.add_argument('--confidence', type=float, default=0.95)
+    parser.add_argument('--n-jobs', type=int, default=None, help="local workers (default: memory budget)")
+    parser.add_argument('--workers', metavar='HOST:PORT',
+                        help="evaluate on work_queue.py workers connecting to this address instead of local processes")
+    parser.add_argument('--output', help="CSV file for the indices")
+    args = parser.parse_args()
+
+    from memory_scheduler import get_scheduler
+    from work_queue import WorkQueue
+    # The module's own analyse, so the points are evaluated by
+    # sensitivity.score_params, which remote workers can import (not __main__)
+    from sensitivity import analyse
+    if args.model == 'cd':
+        from cd_main import load_data, param_grid
+        from cd_optimise import MyModel
+    else:
+        from bc_main import load_data, param_grid
+        from bc_optimise import MyModel
+
+    # Same target as the mains
+    y = load_data('random_data.csv').iloc[:, -1]
+    X = np.ones((y.shape[0], 1))
+    model = MyModel(engine=args.engine, seed=args.seed, n_replicates=args.replicates)
+    n_jobs = args.n_jobs or get_scheduler().max_workers(args.model, param_grid)
+    executor = WorkQueue(args.workers, verbose=1) if args.workers else None
+    try:
+        indices = analyse(model, param_grid, X, y, args.method, args.n, args.levels, args.bootstrap,
+                          args.confidence, args.seed, n_jobs, executor, verbose=1)
+    finally:
+        if executor is not None:
+            executor.close()
+
+    print(indices.to_string(float_format=lambda v: f'{v:.4g}'))
+    print(f"Candidates to freeze: {', '.join(unimportant(indices)) or 'none'}")
+    if args.output:
+        indices.to_csv(args.output)
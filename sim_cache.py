@@ -0,0 +1,178 @@
+import hashlib
+import json
+import os
+import tempfile
+import zipfile
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+# On-disk cache of simulation outputs shared by all processes and runs.
+# Entries are keyed by a hash of the model/engine source files, the parameter
+# dict and the seed, and hold the output frame column by column in a
+# compressed .npz file. Writes go through a temporary file and os.replace, so
+# concurrent joblib workers never see half-written entries. Once the cache
+# grows past its size limit the least recently used entries are evicted.
+
+CACHE_FORMAT = 1
+CACHE_DIR = os.environ.get('SIM_CACHE_DIR', os.path.join(os.path.dirname(os.path.realpath(__file__)), '.sim_cache'))
+CACHE_MAX_MB = float(os.environ.get('SIM_CACHE_MAX_MB', 1024))
+
+_digests = {}
+
+def file_digest(path):
+    # Hash of a file's content, remembered per modification time
+    stat = os.stat(path)
+    cached = _digests.get(path)
+    if cached is not None and cached[0] == stat.st_mtime_ns:
+        return cached[1]
+    with open(path, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    _digests[path] = (stat.st_mtime_ns, digest)
+    return digest
+
+def canonical(value):
+    # Plain Python values for numpy scalars so equal parameters hash equally
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (list, tuple)):
+        return [canonical(v) for v in value]
+    if isinstance(value, dict):
+        return {str(k): canonical(v) for k, v in value.items()}
+    return value
+
+class NotRecorded(Exception):
+    # Raised by SimulationCache.run inside recorded_only() instead of simulating
+    pass
+
+# Set by recorded_only(): cache misses raise NotRecorded
+_recorded_only = False
+
+@contextmanager
+def recorded_only():
+    # Predictions only from runs that are already in the cache, e.g. to plot
+    # the results of a search without simulating anything again
+    global _recorded_only
+    previous, _recorded_only = _recorded_only, True
+    try:
+        yield
+    finally:
+        _recorded_only = previous
+
+def parameter_hash(parameters):
+    text = json.dumps(canonical(parameters), sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+class SimulationCache:
+    def __init__(self, directory=CACHE_DIR, max_mb=CACHE_MAX_MB):
+        self.directory = directory
+        self.max_bytes = max_mb * 2 ** 20
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, sources, parameters, seed=None):
+        # sources: model/engine files whose content determines the output
+        text = json.dumps({
+            'format': CACHE_FORMAT,
+            'sources': [file_digest(source) for source in sources],
+            'parameters': canonical(parameters),
+            'seed': canonical(seed)
+        }, sort_keys=True)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.npz')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as entry:
+                columns = [str(c) for c in entry['__columns__']]
+                data = {}
+                for i, column in enumerate(columns):
+                    values = entry[f'c{i}']
+                    if values.dtype.kind == 'S':
+                        values = values.astype(str).astype(object)
+                    data[column] = values
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            # Damaged entry: drop it and simulate again
+            self._remove(path)
+            return None
+        return pd.DataFrame(data)
+
+    def put(self, key, df):
+        arrays = {'__columns__': np.array([str(c) for c in df.columns])}
+        for i, column in enumerate(df.columns):
+            values = df[column].to_numpy()
+            if values.dtype == object:
+                values = values.astype(str).astype('S')
+            arrays[f'c{i}'] = values
+
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez_compressed(f, **arrays)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            self._remove(tmp)
+            raise
+        self.evict()
+
+    def evict(self):
+        # Remove least recently used entries until the cache fits max_bytes
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.npz'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def run(self, run_func, sources, parameters, seed=None):
+        # Return the cached output for these inputs or simulate and store it
+        from instrument import note, phase  # instrument itself imports this module
+
+        if seed is None or (isinstance(seed, (list, tuple)) and None in seed):
+            # An unseeded run (or batch of replicates) is a new random
+            # realisation every time, so there is nothing to reuse (and
+            # nothing recorded to read back)
+            if _recorded_only:
+                raise NotRecorded(None)
+            return run_func(parameters, seed=seed)
+
+        key = self.key(sources, parameters, seed)
+        with phase('cache_get'):
+            df = self.get(key)
+        note(cache_hit=df is not None)
+        if df is None and _recorded_only:
+            raise NotRecorded(key)
+        if df is None:
+            df = run_func(parameters, seed=seed)
+            with phase('cache_put'):
+                self.put(key, df)
+        return df
+
+# One cache object per process, created on first use
+_cache = None
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        _cache = SimulationCache()
+    return _cache
@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+from bc_engine import run_model_with_parameters, run_replicates
+from search_cv import replicate_seeds
+
+PARAMETERS = {'original': 'false', 'communication_regime': 'HK (select all)', 'number_of_agents': 60,
+              'extremism_range': 0.1, 'extremism_type': 'one side', 'alpha': 1, 'beta': 1,
+              'entry_exit_rate': 0.1, 'min_eps': 0.1, 'max_eps': 0.9}
+
+# Common random numbers: replicate r of a batch is the single run with its seed
+@pytest.mark.parametrize('regime', ['HK (select all)', 'DW (select one)'])
+@pytest.mark.parametrize('original', ['true', 'false'])
+def test_replicates_reproduce_single_runs(regime, original):
+    parameters = dict(PARAMETERS, communication_regime=regime, original=original)
+    seeds = replicate_seeds(0, 3)
+    batch = run_replicates(parameters, seeds, ticks=5)
+    for r, seed in enumerate(seeds):
+        single = run_model_with_parameters(parameters, ticks=5, seed=seed)['[opinion] of turtles']
+        np.testing.assert_array_equal(batch[batch['replicate'] == r]['[opinion] of turtles'], single)
+
+def test_unseeded_replicates_stay_unseeded():
+    assert replicate_seeds(None, 1) == [None]
+    assert replicate_seeds(None, 3) == [None] * 3
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from bc_error import error, error_batch
+
+fastdtw = pytest.importorskip('fastdtw')
+
+# The bc error before dtw.py: fastdtw with this point metric. fastdtw only
+# approximates DTW (it refines a warping path found on coarsened series within
+# `radius` cells), so its distance is the cost of *a* warping path, never less
+# than the optimal one that dtw.py computes. On noisy series the gap is large
+# (492 against 120 for seed 0 of test_error_never_exceeds_old_fastdtw): that
+# is the change in scale of the errors, which are now the true DTW distances.
+# The exact fastdtw.dtw with the same metric is the reference the new error
+# must reproduce.
+def my_metric(x, y, model_std, *args, **kwargs):
+    model_median = np.median(x)
+    model_mean = np.mean(x)
+    if (abs(model_median - y) <= model_std).any() or (abs(model_mean - y) <= model_std).any():
+        return 0
+    else:
+        return abs(x - y)
+
+def old_metric(model_data):
+    std = np.std(model_data)
+    return lambda x, y: my_metric(x, y, model_std=std)
+
+# Sums of the same costs in another order
+TOLERANCE = 1e-9
+
+def series(seed, n, m):
+    rng = np.random.default_rng(seed)
+    return rng.normal(50, 10, n), rng.normal(50, 10, m)
+
+@pytest.mark.parametrize('seed, n, m', [(0, 100, 100), (1, 80, 120), (2, 150, 60), (3, 1, 30)])
+def test_error_matches_exact_dtw_of_old_metric(seed, n, m):
+    model_data, target = series(seed, n, m)
+    expected, _ = fastdtw.dtw(model_data, target, dist=old_metric(model_data))
+    assert error(model_data, pd.DataFrame({'y': target})) == pytest.approx(expected, abs=TOLERANCE)
+
+@pytest.mark.parametrize('seed', range(5))
+def test_error_never_exceeds_old_fastdtw(seed):
+    model_data, target = series(seed, 100, 100)
+    old, _ = fastdtw.fastdtw(model_data, target, dist=old_metric(model_data))
+    assert error(model_data, target) <= old + TOLERANCE
+
+def test_error_batch_matches_error():
+    rng = np.random.default_rng(4)
+    target = rng.normal(50, 10, 90)
+    runs = [rng.normal(50, 10, n) for n in (90, 70, 110)]
+    assert np.allclose(error_batch(runs, target), [error(run, target) for run in runs], atol=TOLERANCE)
@@ -0,0 +1,37 @@
+import socket
+import sqlite3
+import subprocess
+import sys
+
+import numpy as np
+
+from bc_optimise import MyModel
+from search_cv import FoldSharedSearchCV
+
+def search(journal):
+    return FoldSharedSearchCV(MyModel(engine='numpy', seed=0, cache=False),
+                              {'alpha': list(range(1, 9)), 'beta': list(range(1, 9))}, n_iter=3, cv=2,
+                              journal=journal)
+
+# A trial another live process on this host is running is neither run again
+# nor replaced by another candidate: it counts against n_iter (without a
+# random_state every run samples other candidates)
+def test_resume_leaves_running_trials_to_their_process(tmp_path):
+    journal = str(tmp_path / 'search.db')
+    y = np.random.default_rng(0).uniform(size=40)
+    X = np.ones((len(y), 1))
+    search(journal).fit(X, y)
+
+    other = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])
+    try:
+        with sqlite3.connect(journal) as connection:
+            keys = [key for key, in connection.execute('SELECT key FROM trials ORDER BY key')]
+            connection.execute("UPDATE trials SET status = 'running', pid = ?, host = ? WHERE key = ?",
+                               (other.pid, socket.gethostname(), keys[0]))
+            connection.execute('DELETE FROM trials WHERE key = ?', (keys[1],))
+        resumed = search(journal).fit(X, y)
+    finally:
+        other.kill()
+        other.wait()
+    # The finished trial is read back and one new candidate simulated
+    assert len(resumed.cv_results_['params']) == 2
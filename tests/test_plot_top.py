@@ -0,0 +1,23 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+# A whole bc_main search on the NumPy engine with the default seed: --plot-top
+# must find every candidate it plots in the simulation cache the search filled
+def test_bc_main_plot_top_writes_figures(tmp_path):
+    data = tmp_path / 'data.csv'
+    pd.DataFrame({'Value': np.random.default_rng(0).uniform(size=100)}).to_csv(data, index=False)
+    fits = tmp_path / 'fits'
+    env = dict(os.environ, SIM_CACHE_DIR=str(tmp_path / 'cache'), MPLBACKEND='Agg')
+    completed = subprocess.run(
+        [sys.executable, os.path.join(HERE, 'bc_main.py'), '--engine', 'numpy', '--data', str(data),
+         '--search', 'random', '--n-iter', '3', '--plot-top', '2', '--plot-dir', str(fits)],
+        env=env, capture_output=True, text=True, timeout=600)
+    assert completed.returncode == 0, completed.stderr
+    assert 'not in the simulation cache' not in completed.stdout
+    assert sorted(os.listdir(fits)) == ['bc_001_rank1.png', 'bc_002_rank2.png']
@@ -0,0 +1,22 @@
+import time
+
+import numpy as np
+import pytest
+
+from bc_optimise import MyModel
+from search_cv import FoldSharedSearchCV
+from work_queue import TaskFailed, WorkQueue
+
+def test_search_without_workers_fails_after_worker_timeout():
+    queue = WorkQueue(('localhost', 0), worker_timeout=1)
+    y = np.random.default_rng(0).uniform(size=40)
+    search = FoldSharedSearchCV(MyModel(engine='numpy', seed=0, cache=False),
+                                {'alpha': [1, 2], 'beta': [1, 2]}, n_iter=2, cv=2,
+                                executor=queue)
+    start = time.time()
+    try:
+        with pytest.raises(TaskFailed):
+            search.fit(np.ones((len(y), 1)), y)
+    finally:
+        queue.close()
+    assert time.time() - start < 10
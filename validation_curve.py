@@ -0,0 +1,59 @@
+import numpy as np
+import matplotlib.pyplot as plt
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.model_selection import KFold
+
+# Validation curve over the number of CV splits for one fixed parameter set,
+# shared by bc_validation_curve.py and cd_validation_curve.py. The parameter
+# set is simulated once (once per replicate with n_replicates > 1) and every
+# fold of every split count is scored against those same predictions, the
+# split counts in parallel.
+
+def simulate(model, params, X):
+    # Predictions of every replicate of the parameter set
+    model = clone(model).set_params(**params)
+    model.fit(X)
+    model.predict(X)
+    return list(model.replicate_predictions_)
+
+def fold_scores(predictions, y, n_splits, error_func):
+    # Error of every KFold test fold, averaged over the replicates
+    y = np.asarray(y)
+    return np.array([np.mean([error_func(p, y[test]) for p in predictions])
+                     for _, test in KFold(n_splits=n_splits).split(y)])
+
+def validation_curve(model, params, X, y, error_func, n_splits_range, n_jobs=None, prepare=None):
+    # Mean and std of the fold errors for every split count, and the fold
+    # errors themselves. prepare turns a prediction into a form that is
+    # cheaper to score and to send to the workers (done once per replicate).
+    predictions = simulate(model, params, X)
+    if prepare is not None:
+        predictions = [prepare(p) for p in predictions]
+    scores = Parallel(n_jobs=n_jobs)(
+        delayed(fold_scores)(predictions, y, n_splits, error_func) for n_splits in n_splits_range)
+    means = np.array([np.mean(s) for s in scores])
+    stds = np.array([np.std(s) for s in scores])
+    return means, stds, scores
+
+def report(n_splits_range, cv_scores_mean, cv_scores_std):
+    # Plot the validation curve and print the split count with the lowest mean error
+    plt.figure(figsize=(10, 6))
+    plt.plot(n_splits_range, cv_scores_mean, color='blue', marker='o', markersize=5, label='mean cross-validated error')
+    plt.fill_between(n_splits_range, cv_scores_mean - cv_scores_std, cv_scores_mean + cv_scores_std, alpha=0.15, color='blue')
+    plt.title('Validation curve')
+    plt.xlabel('n_splits')
+    plt.ylabel('Cross-validated error')
+    plt.grid()
+    plt.legend(loc='upper right')
+
+    min_mean_idx = np.argmin(cv_scores_mean) # Find index where mean score is minimum
+    optimal_n_splits = n_splits_range[min_mean_idx] # Find the n_splits value corresponding to this index
+    std_at_min_mean = cv_scores_std[min_mean_idx] # Fetch the standard deviation corresponding to this minimum mean
+
+    print(f"The optimal number of splits is: {optimal_n_splits}")
+    print(f"The error at this split is: {cv_scores_mean[min_mean_idx]}")
+    print(f"The standard deviation at this split is: {std_at_min_mean}")
+
+    plt.show()
+    return optimal_n_splits
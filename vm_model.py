@@ -0,0 +1,241 @@
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+# Python version of Voting.nlogo and Voting_w_clusters.nlogo (majority rule
+# voter model). Many replicates are held at once in a stacked
+# (replicates x height x width) uint8 array and advanced together; each
+# replicate stops on its own once none of its votes change any more, or once
+# it is back in a state it had a few ticks before: with change-vote-if-tied?
+# on, tied patches can flip back and forth for ever (period 2), which the
+# NetLogo stop condition never sees. States are compared bit-packed.
+# Like the NetLogo models the world wraps in both directions.
+
+# Longest cycle looked for (states of this many past ticks are remembered)
+MAX_PERIOD = 8
+
+# Once fewer cells than this share of the active grids changed, only their
+# 3 x 3 neighbourhoods are updated instead of every cell
+DENSE_FRACTION = 0.01
+
+def neighbour_totals(votes):
+    # "sum [vote] of neighbors" for every grid of the batch at once: a wrapped
+    # 3 x 3 box convolution done as two separable 1D sums, minus the centre
+    padded = np.pad(votes, ((0, 0), (1, 1), (1, 1)), mode='wrap')
+    rows = padded[:, :, :-2] + padded[:, :, 1:-1] + padded[:, :, 2:]
+    return rows[:, :-2] + rows[:, 1:-1] + rows[:, 2:] - votes
+
+def rule_table(change_vote_if_tied=False, award_close_calls_to_loser=False):
+    # New vote for every (old vote, total) pair following the 'go' procedure
+    table = np.zeros((2, 9), dtype=np.uint8)
+    for vote in (0, 1):
+        for total in range(9):
+            new_vote = vote
+            if total > 5:
+                new_vote = 1
+            if total < 3:
+                new_vote = 0
+            if total == 4 and change_vote_if_tied:
+                new_vote = 1 - vote
+            if total == 5:
+                new_vote = 0 if award_close_calls_to_loser else 1
+            if total == 3:
+                new_vote = 1 if award_close_calls_to_loser else 0
+            table[vote, total] = new_vote
+    return table
+
+def apply_rules(votes, total, change_vote_if_tied=False, award_close_calls_to_loser=False):
+    # Majority rule applied to the whole batch with a single table lookup
+    table = rule_table(change_vote_if_tied, award_close_calls_to_loser).ravel()
+    return table[votes * 9 + total]
+
+def setup_random(n_replicates, world_width=151, world_height=151, rng=None):
+    # setup in Voting.nlogo: every patch votes 0 or 1 at random
+    rng = np.random.default_rng(rng)
+    return rng.integers(0, 2, size=(n_replicates, world_height, world_width), dtype=np.uint8)
+
+def setup_clusters(n_replicates, num_clusters=4, cluster_std_dev=98, world_width=151, world_height=151, rng=None):
+    # generate-clusters in Voting_w_clusters.nlogo. All patches start blue
+    # (vote 1) and clusters of green (vote 0) patches are grown around random
+    # centres. The "patches with [distance ...]" scans are replaced by torus
+    # distance masks computed for all replicates at once.
+    rng = np.random.default_rng(rng)
+    votes = np.ones((n_replicates, world_height, world_width), dtype=np.uint8)
+    flat = votes.reshape(n_replicates, -1)
+
+    # Patch coordinates of a world centred on the origin
+    max_pxcor = (world_width - 1) // 2
+    max_pycor = (world_height - 1) // 2
+    pxcor = np.arange(world_width) - max_pxcor
+    pycor = np.arange(world_height) - max_pycor
+
+    num_data_points = 11300 + rng.integers(0, 11500 - 11300, size=n_replicates)
+    data_points = num_data_points / num_clusters
+    colored_patches = np.zeros(n_replicates, dtype=int)
+    cluster_radius = cluster_std_dev / 2 * min(world_width / 301, world_height / 301)
+
+    # Cluster centres are drawn from a box around the origin
+    centre_x = pxcor[np.abs(pxcor) < max_pxcor / (1 + 0.5 * world_width / 301)]
+    centre_y = pycor[np.abs(pycor) < max_pycor / (1 + 0.5 * world_height / 301)]
+
+    for _ in range(num_clusters):
+        cx = rng.choice(centre_x, size=n_replicates)
+        cy = rng.choice(centre_y, size=n_replicates)
+
+        dx = np.abs(pxcor[None, :] - cx[:, None])
+        dx = np.minimum(dx, world_width - dx)
+        dy = np.abs(pycor[None, :] - cy[:, None])
+        dy = np.minimum(dy, world_height - dy)
+        within = dy[:, :, None] ** 2 + dx[:, None, :] ** 2 <= cluster_radius ** 2
+        nearby = within.reshape(n_replicates, -1) & (flat == 1)
+
+        patches_to_color = np.minimum(data_points, nearby.sum(axis=1)).astype(int)
+        patches_to_color = np.minimum(patches_to_color, num_data_points - colored_patches)
+        _color_random(flat, nearby, patches_to_color, rng)
+        colored_patches += patches_to_color
+
+    # Colour the remaining patches at random if the clusters were too small
+    remaining = num_data_points - colored_patches
+    _color_random(flat, flat == 1, np.maximum(remaining, 0), rng)
+
+    return votes
+
+def _color_random(flat, candidates, counts, rng):
+    # "ask n-of count candidates [set vote 0]" for every replicate: give the
+    # candidates random keys and take the `count` smallest of each row
+    keys = rng.random(flat.shape)
+    keys[~candidates] = np.inf
+    threshold = np.sort(keys, axis=1)[np.arange(len(flat)), np.maximum(counts - 1, 0)]
+    flat[(keys <= threshold[:, None]) & (counts[:, None] > 0)] = 0
+
+def step(votes, change_vote_if_tied=False, award_close_calls_to_loser=False):
+    # One tick: all totals are computed before any vote changes
+    return apply_rules(votes, neighbour_totals(votes), change_vote_if_tied, award_close_calls_to_loser)
+
+def neighbour_indices(cells, height, width):
+    # Flat indices of the 8 wrapped neighbours of flat cell indices into a
+    # stacked (replicates x height x width) array, one row per cell
+    grid, offset = np.divmod(cells, height * width)
+    y, x = np.divmod(offset, width)
+    dy = np.array([-1, -1, -1, 0, 0, 1, 1, 1])
+    dx = np.array([-1, 0, 1, -1, 1, -1, 0, 1])
+    return (grid * (height * width))[:, None] + ((y[:, None] + dy) % height) * width + (x[:, None] + dx) % width
+
+def _frontier(marked, changed, neighbours):
+    # Sorted union of the changed cells and their neighbours (marked is an
+    # all-False scratch mask, left all-False again)
+    marked[changed] = True
+    marked[neighbours.ravel()] = True
+    cells = np.flatnonzero(marked)
+    marked[cells] = False
+    return cells
+
+def run(votes, change_vote_if_tied=False, award_close_calls_to_loser=False, max_ticks=None, max_period=MAX_PERIOD):
+    # Advance the batch in place until every replicate has stabilised or
+    # entered a cycle of at most max_period ticks (None: any length), or
+    # max_ticks is reached. Returns for every replicate the ticks run, the
+    # period of the cycle it ended in (1: stable, 0: none found) and the
+    # transient (ticks before the cycle started).
+    n_replicates, height, width = votes.shape
+    cells = height * width
+    table = rule_table(change_vote_if_tied, award_close_calls_to_loser).ravel()
+    state = np.ascontiguousarray(votes)
+    flat = state.reshape(-1)
+    totals = np.zeros(state.size, dtype=np.int16)  # kept up to date on the frontier only
+
+    active = np.ones(n_replicates, dtype=bool)
+    ticks = np.zeros(n_replicates, dtype=int)
+    period = np.zeros(n_replicates, dtype=int)
+    transient = np.zeros(n_replicates, dtype=int)
+    # Packed states of the last max_period ticks: state -> tick
+    seen = [{np.packbits(state[r]).tobytes(): 0} for r in range(n_replicates)]
+    order = [deque(seen[r]) for r in range(n_replicates)]
+    candidates = None  # cells that may change; None: all cells of the active grids
+    marked = np.zeros(state.size, dtype=bool)
+    steps = 0
+
+    while active.any():
+        if max_ticks is not None and steps >= max_ticks:
+            break
+        steps += 1
+
+        # All totals are computed before any vote changes
+        if candidates is None:
+            index = np.flatnonzero(active)
+            current = state[index]
+            new_grids = step(current, change_vote_if_tied, award_close_calls_to_loser)
+            differs = new_grids != current
+            state[index] = new_grids
+            n_changes = np.zeros(n_replicates, dtype=int)
+            n_changes[index] = differs.reshape(len(index), cells).sum(axis=1)
+        else:
+            new = table[flat[candidates] * 9 + totals[candidates]]
+            changing = new != flat[candidates]
+            changed = candidates[changing]
+            delta = new[changing].astype(np.int16) - flat[changed]
+            flat[changed] = new[changing]
+            n_changes = np.bincount(changed // cells, minlength=n_replicates)
+
+        stable = active & (n_changes == 0)
+        period[stable] = 1
+        transient[stable] = steps - 1
+        active[stable] = False
+        ticks[active] = steps
+
+        for r in np.flatnonzero(active):
+            key = np.packbits(state[r]).tobytes()
+            previous = seen[r].get(key)
+            if previous is not None:
+                period[r] = steps - previous
+                transient[r] = previous
+                active[r] = False
+                continue
+            seen[r][key] = steps
+            order[r].append(key)
+            if max_period is not None and len(order[r]) > max_period:
+                del seen[r][order[r].popleft()]
+
+        if n_changes[active].sum() > DENSE_FRACTION * active.sum() * cells:
+            candidates = None
+        elif candidates is None:
+            # Leaving the dense updates: totals of the grids as they are now
+            local = np.flatnonzero(differs[active[index]])
+            changed = np.flatnonzero(active)[local // cells] * cells + local % cells
+            for r in np.flatnonzero(active):
+                totals[r * cells:(r + 1) * cells] = neighbour_totals(state[r:r + 1]).ravel()
+            candidates = _frontier(marked, changed, neighbour_indices(changed, height, width))
+        else:
+            # Frontier: only the changed cells and their neighbours can change next
+            keep = active[changed // cells]
+            neighbours = neighbour_indices(changed[keep], height, width)
+            np.add.at(totals, neighbours.ravel(), np.repeat(delta[keep], 8))
+            candidates = _frontier(marked, changed[keep], neighbours)
+
+    if state is not votes:
+        votes[...] = state
+    return ticks, period, transient
+
+def run_model_with_parameters(parameters, n_replicates=1, seed=None, max_ticks=None, max_period=MAX_PERIOD):
+    rng = np.random.default_rng(seed)
+    world_width = parameters.get("world_width", 151)
+    world_height = parameters.get("world_height", 151)
+
+    if parameters.get("clusters", False):
+        votes = setup_clusters(n_replicates, parameters.get("num_clusters", 4), parameters.get("cluster_std_dev", 98),
+                               world_width, world_height, rng)
+    else:
+        votes = setup_random(n_replicates, world_width, world_height, rng)
+
+    ticks, period, transient = run(votes, parameters.get("change_vote_if_tied", False),
+                                   parameters.get("award_close_calls_to_loser", False), max_ticks, max_period)
+
+    # One row per replicate: run length, the cycle it ended in (period 1:
+    # stable, 0: still changing at max_ticks) and share of patches voting 1 (blue)
+    return pd.DataFrame({
+        'replicate': np.arange(n_replicates),
+        'ticks': ticks,
+        'period': period,
+        'transient': transient,
+        'share_vote_1': votes.mean(axis=(1, 2))
+    })
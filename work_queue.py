@@ -0,0 +1,320 @@
+import argparse
+import ipaddress
+import itertools
+import os
+import pickle
+import secrets
+import socket
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from multiprocessing.connection import Client, Listener
+
+# Work queue for spreading evaluations over processes on any number of hosts.
+# A coordinator (WorkQueue, living in the search process) holds the queue of
+# tasks, i.e. a picklable function and its arguments, and listens on a TCP
+# port. Workers connect to it, ask for up to `batch` tasks at a time, run them
+# and send the results back per batch. While running they send heartbeats;
+# tasks of a worker that disconnects or misses its heartbeats are handed to
+# another worker. Passed as `executor=` to the searches in search_cv.py it
+# evaluates candidates (MyModel.predict/score) in place of joblib.
+#
+#   python cd_main.py --workers 0.0.0.0:6100        (coordinator)
+#   python work_queue.py worker host:6100 --batch 2  (on every host, as often
+#                                                     as it has cores/memory)
+#
+# Workers import the task functions by name, so they run from a checkout of
+# this repository. Tasks and results are pickled, so whoever knows the key
+# can run code on the coordinator and the workers: all ends must share a
+# secret WORK_QUEUE_AUTHKEY. Without one the coordinator only listens on
+# loopback addresses, with a random key per queue for start_local_workers.
+
+AUTHKEY = os.environ.get('WORK_QUEUE_AUTHKEY', '').encode() or None
+HEARTBEAT = float(os.environ.get('WORK_QUEUE_HEARTBEAT', 5))
+# Results waited for fail once no worker was connected for this many seconds
+WORKER_TIMEOUT = float(os.environ.get('WORK_QUEUE_WORKER_TIMEOUT', 60))
+
+def parse_address(address):
+    # 'host:port' or (host, port)
+    if isinstance(address, str):
+        host, port = address.rsplit(':', 1)
+        return host, int(port)
+    return tuple(address)
+
+def is_loopback(host):
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+class TaskFailed(Exception):
+    pass
+
+class WorkQueue:
+    def __init__(self, address=('localhost', 0), authkey=AUTHKEY, heartbeat=HEARTBEAT,
+                 max_attempts=3, worker_timeout=WORKER_TIMEOUT, verbose=0):
+        address = parse_address(address)
+        if authkey is None:
+            if not is_loopback(address[0]):
+                raise ValueError(f"listening on {address[0]} needs a secret WORK_QUEUE_AUTHKEY")
+            authkey = secrets.token_hex(16).encode()
+        self.authkey = authkey
+        self.heartbeat = heartbeat
+        self.max_attempts = max_attempts
+        self.worker_timeout = worker_timeout
+        self.verbose = verbose
+        self.listener = Listener(address, authkey=authkey)
+        self.address = self.listener.address
+        self._ids = itertools.count()
+        self._pending = deque()   # task ids not handed out
+        self._tasks = {}          # task id -> pickled (func, args)
+        self._attempts = {}
+        self._results = {}        # task id -> (ok, value)
+        self._workers = {}        # worker name -> task ids it holds
+        self._no_workers_since = time.time()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._accepter = threading.Thread(target=self._accept, daemon=True)
+        self._accepter.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def n_workers(self):
+        with self._condition:
+            return len(self._workers)
+
+    def wait_for_workers(self, n=1, timeout=None):
+        # Block until n workers are connected (or timeout seconds passed);
+        # returns the number connected
+        deadline = None if timeout is None else time.time() + timeout
+        with self._condition:
+            while len(self._workers) < n and not self._closed:
+                wait = self.heartbeat
+                if deadline is not None:
+                    wait = min(wait, deadline - time.time())
+                    if wait <= 0:
+                        break
+                self._condition.wait(wait)
+            return len(self._workers)
+
+    def _log(self, message):
+        if self.verbose:
+            print(f"WorkQueue: {message}", flush=True)
+
+    def _accept(self):
+        while not self._closed:
+            try:
+                conn = self.listener.accept()
+            except Exception:
+                if self._closed:
+                    return
+                continue  # failed handshake (wrong authkey, port scan)
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        # One thread per connected worker
+        name = None
+        try:
+            kind, name = conn.recv()
+            conn.send(('welcome', self.heartbeat))
+            with self._condition:
+                self._workers[name] = set()
+                self._condition.notify_all()
+            self._log(f"worker {name} connected ({len(self._workers)} workers)")
+            while True:
+                # Heartbeats arrive every self.heartbeat seconds; several
+                # missed ones mean the worker is lost
+                if not conn.poll(3 * self.heartbeat):
+                    self._log(f"worker {name} missed its heartbeats")
+                    break
+                message = conn.recv()
+                if message[0] == 'ready':
+                    tasks = self._take(name, message[1])
+                    if tasks is None:
+                        conn.send(('stop',))
+                        break
+                    conn.send(('tasks', tasks))
+                elif message[0] == 'results':
+                    self._finish(name, message[1])
+        except (EOFError, OSError, ValueError):
+            self._log(f"worker {name} disconnected")
+        finally:
+            self._lose(name)
+            conn.close()
+
+    def _take(self, name, n):
+        # Wait for tasks; None once the queue is closed
+        with self._condition:
+            while not self._pending and not self._closed:
+                self._condition.wait(self.heartbeat)
+            if self._closed:
+                return None
+            tasks = []
+            while self._pending and len(tasks) < n:
+                task_id = self._pending.popleft()
+                self._attempts[task_id] += 1
+                self._workers[name].add(task_id)
+                tasks.append((task_id, self._tasks[task_id]))
+            return tasks
+
+    def _finish(self, name, results):
+        with self._condition:
+            for task_id, ok, value in results:
+                self._workers[name].discard(task_id)
+                if task_id in self._tasks:
+                    del self._tasks[task_id]
+                    self._results[task_id] = (ok, value)
+            self._condition.notify_all()
+
+    def _lose(self, name):
+        # Requeue the unfinished tasks of a lost worker (first in line)
+        with self._condition:
+            for task_id in sorted(self._workers.pop(name, ()), reverse=True):
+                if task_id not in self._tasks:
+                    continue
+                if self._attempts[task_id] >= self.max_attempts:
+                    del self._tasks[task_id]
+                    self._results[task_id] = (False, f"lost {self._attempts[task_id]} workers running it")
+                else:
+                    self._pending.appendleft(task_id)
+            if not self._workers:
+                self._no_workers_since = time.time()
+            self._condition.notify_all()
+
+    def submit(self, func, *args):
+        # Pickled one by one, so a worker that can't load one task (e.g. a
+        # function defined in __main__) fails only that task
+        payload = pickle.dumps((func, args))
+        with self._condition:
+            task_id = next(self._ids)
+            self._tasks[task_id] = payload
+            self._attempts[task_id] = 0
+            self._pending.append(task_id)
+            self._condition.notify_all()
+        return task_id
+
+    def result(self, task_id):
+        # Block until the task is done; raises TaskFailed if it failed or no
+        # worker was connected for worker_timeout seconds
+        with self._condition:
+            while task_id not in self._results:
+                if self._closed:
+                    raise TaskFailed("work queue closed")
+                if not self._workers and time.time() - self._no_workers_since > self.worker_timeout:
+                    raise TaskFailed(f"no workers connected for {self.worker_timeout:g} s")
+                self._condition.wait(self.heartbeat)
+            ok, value = self._results.pop(task_id)
+            del self._attempts[task_id]
+        if not ok:
+            raise TaskFailed(value)
+        return value
+
+    def map(self, func, argument_lists):
+        # func(*arguments) for every entry, in order
+        task_ids = [self.submit(func, *arguments) for arguments in argument_lists]
+        return [self.result(task_id) for task_id in task_ids]
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self.listener.close()
+
+def picklable(value):
+    try:
+        pickle.dumps(value)
+        return True
+    except Exception:
+        return False
+
+def start_local_workers(queue, n=1, batch=1):
+    # Worker processes on this host for a WorkQueue (they get its key),
+    # e.g. for tests; returns the Popen objects
+    host, port = queue.address
+    authkey = queue.authkey
+    env = dict(os.environ, WORK_QUEUE_AUTHKEY=authkey.decode())
+    script = os.path.realpath(__file__)
+    return [subprocess.Popen([sys.executable, script, 'worker', f'{host}:{port}', '--batch', str(batch)],
+                             cwd=os.path.dirname(script), env=env)
+            for _ in range(n)]
+
+def work(address, batch=1, authkey=AUTHKEY, connect_timeout=60):
+    # Worker loop: run tasks until the coordinator stops or goes away.
+    # Waits up to connect_timeout seconds for the coordinator to come up.
+    if authkey is None:
+        raise ValueError("set WORK_QUEUE_AUTHKEY to the coordinator's key")
+    address = parse_address(address)
+    deadline = time.time() + connect_timeout
+    while True:
+        try:
+            conn = Client(address, authkey=authkey)
+            break
+        except ConnectionRefusedError:
+            if time.time() > deadline:
+                raise
+            time.sleep(1)
+
+    lock = threading.Lock()
+    stopped = threading.Event()
+
+    def send(message):
+        with lock:
+            conn.send(message)
+
+    def beat():
+        # Also while receiving tasks, whose unpickling may import slow modules
+        while not stopped.wait(heartbeat):
+            try:
+                send(('heartbeat',))
+            except OSError:
+                return
+
+    send(('hello', f'{socket.gethostname()}-{os.getpid()}'))
+    # The coordinator sets the heartbeat interval
+    heartbeat = conn.recv()[1]
+    threading.Thread(target=beat, daemon=True).start()
+    try:
+        while True:
+            send(('ready', batch))
+            message = conn.recv()
+            if message[0] == 'stop':
+                break
+            results = []
+            for task_id, payload in message[1]:
+                try:
+                    func, args = pickle.loads(payload)
+                    results.append((task_id, True, func(*args)))
+                except Exception:
+                    results.append((task_id, False, traceback.format_exc()))
+            try:
+                send(('results', results))
+            except (pickle.PicklingError, TypeError, AttributeError):
+                send(('results', [(task_id, False, f"result can't be pickled: {value!r:.200}")
+                                  if ok and not picklable(value) else (task_id, ok, value)
+                                  for task_id, ok, value in results]))
+    except (EOFError, OSError):
+        pass  # coordinator gone
+    finally:
+        stopped.set()
+        conn.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Work queue worker")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    worker_parser = subparsers.add_parser('worker', help="run tasks from a coordinator")
+    worker_parser.add_argument('address', help="host:port of the coordinator")
+    worker_parser.add_argument('--batch', type=int, default=1, help="tasks fetched and reported at a time")
+    worker_parser.add_argument('--connect-timeout', type=float, default=60,
+                               help="seconds to wait for the coordinator to start")
+    args = parser.parse_args()
+    work(args.address, batch=args.batch, connect_timeout=args.connect_timeout)